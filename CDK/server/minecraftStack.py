@@ -179,6 +179,25 @@ class MinecraftStack (Stack):
         # Attach the custom policy to the IAM role
         nodejs_task_role.attach_inline_policy(bedrock_policy)
 
+        # Allow the bot to look up the Minecraft server's task IP for RCON
+        ecs_discovery_policy = iam.Policy(
+            self, "EcsDiscoveryPolicy",
+            policy_name="EcsDiscoveryPolicy",
+            document=iam.PolicyDocument(
+                statements=[
+                    iam.PolicyStatement(
+                        actions=[
+                            "ecs:ListTasks",
+                            "ecs:DescribeTasks"
+                        ],
+                        resources=["*"],
+                        effect=iam.Effect.ALLOW
+                    )
+                ]
+            )
+        )
+        nodejs_task_role.attach_inline_policy(ecs_discovery_policy)
+
 # ######################################################
 # Create Amazon ECS task execution IAM role
 
@@ -222,6 +241,12 @@ class MinecraftStack (Stack):
                 "MINECRAFT_BOT_USERNAME" : bot_username,
                 "AGENT_ALIAS_ID" : agent_alias_id,
                 "AGENT_ID" : agent_id,
+                "MINECRAFT_SERVER_PORT_RCON" : str(server_port_rcon),
+                "ECS_CLUSTER" : cluster.cluster_name,
+                "ECS_SERVICE" : minecraft_service.service.service_name,
+            },
+            secrets={
+                "RCON_PASSWORD": ecs.Secret.from_secrets_manager(rcon_secret)
             }
         )
 
@@ -240,6 +265,13 @@ class MinecraftStack (Stack):
             allow_all_outbound=True
         )
 
+        # The bot serves Prometheus metrics on port 3000 (METRICS_PORT), for scrapers inside the VPC only
+        nodejs_security_group.add_ingress_rule(
+            peer=ec2.Peer.ipv4(minecraft_vpc.vpc_cidr_block),
+            connection=ec2.Port.tcp(3000),
+            description="Allow metrics scrapes from within the VPC"
+        )
+
         # Create the Node.js service without a load balancer and with the new security group
         nodejs_service = ecs.FargateService(
             self, "NodeJsService",
@@ -337,6 +369,8 @@ class MinecraftStack (Stack):
                 "MINECRAFT_BOT_USERNAME" : bot_username,
                 "AGENT_ALIAS_ID" : agent_alias_id,
                 "AGENT_ID" : agent_id,
+                "ECS_CLUSTER" : cluster.cluster_name,
+                "ECS_SERVICE" : minecraft_service.service.service_name,
             },
             secrets={
                 "RCON_PASSWORD": ecs.Secret.from_secrets_manager(rcon_secret)
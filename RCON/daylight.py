@@ -1,20 +1,26 @@
+import asyncio
 import logging
-from mcrcon import MCRcon
 import os
 
+from .ecs_discovery import resolve_rcon_host
+from .rcon_client import RconClient
+
 # Configure logging
 logging.basicConfig(filename='/rcon/logs/logfile.log', level=logging.INFO, 
                     format='%(asctime)s:%(levelname)s:%(message)s')
 
-server = '10.0.149.21'
+server = resolve_rcon_host()
 port = os.environ['MINECRAFT_SERVER_PORT_RCON']
 password = os.environ['RCON_PASSWORD']
 
+
+async def main():
+    async with RconClient(server, int(port), password) as rcon:
+        return await rcon.command("/time set noon")
+
 try:
-    with MCRcon(server, password, port=int(port)) as mcr:
-        resp = mcr.command("/time set noon")
-        logging.info(resp)  # Log the response from the server
-        print(resp)  # This will also output to console, can be useful for debugging
+    resp = asyncio.run(main())
+    logging.info(resp)  # Log the response from the server
+    print(resp)  # This will also output to console, can be useful for debugging
 except Exception as e:
     logging.error("Failed to execute RCON command", exc_info=True)  # Log the exception
-
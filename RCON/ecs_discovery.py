@@ -0,0 +1,283 @@
+"""
+Finds the private IP addresses of the Minecraft server's ECS tasks.
+
+Asking ECS takes a ListTasks and a DescribeTasks call, which is too slow to
+do on every RCON command or at every start of a tool. EcsDiscovery keeps the
+addresses in memory and in a small JSON file on disk, each with a time to
+live:
+
+- A fresh entry is returned straight away
+- A stale entry is also returned straight away, and refreshed in the
+  background
+- With no entry at all, the caller can wait for ECS or take the fallback
+  host, such as the load balancer's DNS name, while ECS is asked in the
+  background
+
+    discovery = EcsDiscovery(cluster, service, fallback=nlb_dns_name)
+    host = discovery.host()
+
+Tests and local runs can point it at a stand-in for ECS with endpoint_url or
+pass in their own client, see ecs_stub_server.py.
+
+From the command line it prints the addresses, one per line:
+
+    python -m RCON.ecs_discovery --cluster my-cluster --service my-service
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+# DescribeTasks accepts at most this many tasks per call.
+DESCRIBE_BATCH = 100
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'minecraft-ecs-hosts.json')
+
+logger = logging.getLogger(__name__)
+
+
+def task_ips(task):
+    """Returns the private IPv4 addresses of a described task's network interfaces."""
+    return [
+        detail['value']
+        for attachment in task.get('attachments', [])
+        for detail in attachment.get('details', [])
+        if detail.get('name') == 'privateIPv4Address'
+    ]
+
+
+class EcsDiscovery:
+    """
+    Cached addresses of the running tasks of one ECS service.
+
+    Args:
+        cluster (str): Cluster name or ARN.
+        service (str): Service name.
+        ttl (float): Seconds an answer from ECS is used before it is
+            refreshed.
+        fallback (str): Host returned when ECS has not given any address,
+            e.g. the load balancer's DNS name.
+        cache_path (str): JSON file the addresses are kept in between runs.
+            None keeps them in memory only.
+        client: An ECS client to use. Defaults to a boto3 client.
+        endpoint_url (str): ECS endpoint for the default client, e.g. a
+            local stand-in.
+        region_name (str): Region for the default client.
+    """
+
+    def __init__(self, cluster, service, ttl=60, fallback=None, cache_path=DEFAULT_CACHE_PATH,
+                 client=None, endpoint_url=None, region_name=None):
+        self.cluster = cluster
+        self.service = service
+        self.ttl = ttl
+        self.fallback = fallback
+        self.cache_path = cache_path
+        self.endpoint_url = endpoint_url
+        self.region_name = region_name
+        self._client = client
+        self._ips = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._load()
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('ecs', endpoint_url=self.endpoint_url, region_name=self.region_name)
+        return self._client
+
+    def hosts(self, wait=True):
+        """
+        Returns the private IPs of the service's running tasks.
+
+        Args:
+            wait (bool): When nothing is cached, whether to wait for ECS.
+                Otherwise an empty list is returned and ECS is asked in the
+                background.
+        """
+        with self._lock:
+            ips, age = self._ips, time.time() - self._fetched_at
+        if ips is not None:
+            if age > self.ttl:
+                self.refresh_in_background()
+            return list(ips)
+        if not wait:
+            self.refresh_in_background()
+            return []
+        try:
+            return self.refresh()
+        except Exception as e:
+            logger.warning(f"Could not list the tasks of {self.service}: {e}")
+            return []
+
+    def host(self, wait=True):
+        """Returns the first task's IP, or the fallback host if there is none."""
+        ips = self.hosts(wait)
+        if ips:
+            return ips[0]
+        if self.fallback is None:
+            raise LookupError(f"No running tasks found for {self.service}")
+        return self.fallback
+
+    def refresh(self):
+        """Asks ECS for the addresses now, and caches them."""
+        ips = self._fetch()
+        with self._lock:
+            self._ips, self._fetched_at = ips, time.time()
+        self._save(ips)
+        return list(ips)
+
+    def refresh_in_background(self):
+        """Starts a refresh on another thread, unless one is already running."""
+        with self._lock:
+            if self._refreshing is not None and self._refreshing.is_alive():
+                return
+            self._refreshing = threading.Thread(target=self._refresh_quietly, name="ecs-discovery-refresh", daemon=True)
+            self._refreshing.start()
+
+    def start(self):
+        """Keeps the addresses fresh from a background thread until close()."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ecs-discovery", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                due = self._fetched_at + self.ttl / 2 - time.time()
+            if due <= 0:
+                self._refresh_quietly()
+                due = self.ttl / 2
+            self._stop.wait(due)
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # The cached addresses, stale or not, stay in use.
+            logger.warning(f"Could not refresh the tasks of {self.service}: {e}")
+            with self._lock:
+                self._fetched_at = max(self._fetched_at, time.time() - self.ttl / 2)
+
+    def _fetch(self):
+        task_arns = []
+        paginator = self.client.get_paginator('list_tasks')
+        for page in paginator.paginate(cluster=self.cluster, serviceName=self.service, desiredStatus='RUNNING'):
+            task_arns.extend(page.get('taskArns', []))
+
+        ips = []
+        for start in range(0, len(task_arns), DESCRIBE_BATCH):
+            response = self.client.describe_tasks(cluster=self.cluster, tasks=task_arns[start:start + DESCRIBE_BATCH])
+            # Oldest first, so the answer stays the same while tasks come and go.
+            for task in sorted(response.get('tasks', []), key=lambda task: str(task.get('startedAt', ''))):
+                if task.get('lastStatus') == 'RUNNING':
+                    ips.extend(task_ips(task))
+        logger.info(f"Found {len(ips)} task addresses for {self.service}")
+        return ips
+
+    def _key(self):
+        return f"{self.cluster}/{self.service}"
+
+    def _load(self):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path) as f:
+                entry = json.load(f).get(self._key())
+        except (OSError, ValueError, AttributeError):
+            return
+        if entry:
+            self._ips, self._fetched_at = entry['ips'], entry['fetched_at']
+
+    def _save(self, ips):
+        if not self.cache_path:
+            return
+        try:
+            try:
+                with open(self.cache_path) as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                entries = {}
+            entries[self._key()] = {'ips': ips, 'fetched_at': time.time()}
+            # Written to a temporary file and renamed, so readers never see
+            # half a file.
+            directory = os.path.dirname(os.path.abspath(self.cache_path))
+            with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f:
+                json.dump(entries, f)
+            os.replace(f.name, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write the discovery cache {self.cache_path}: {e}")
+
+
+def from_environment(**kwargs):
+    """
+    Returns an EcsDiscovery configured from ECS_CLUSTER, ECS_SERVICE,
+    ECS_DISCOVERY_TTL, ECS_DISCOVERY_CACHE, ECS_ENDPOINT_URL and, as the
+    fallback, MINECRAFT_NLB_DNS_NAME. Returns None if the cluster or service
+    is not set.
+    """
+    cluster = os.environ.get('ECS_CLUSTER')
+    service = os.environ.get('ECS_SERVICE')
+    if not cluster or not service:
+        return None
+    options = {
+        'ttl': float(os.environ.get('ECS_DISCOVERY_TTL', 60)),
+        'fallback': os.environ.get('MINECRAFT_NLB_DNS_NAME'),
+        'cache_path': os.environ.get('ECS_DISCOVERY_CACHE', DEFAULT_CACHE_PATH) or None,
+        'endpoint_url': os.environ.get('ECS_ENDPOINT_URL'),
+    }
+    options.update(kwargs)
+    return EcsDiscovery(cluster, service, **options)
+
+
+def resolve_rcon_host(wait=True):
+    """
+    Returns the RCON host for the tools: RCON_HOST if set, else the first
+    running task found through ECS, else the load balancer. Raises
+    LookupError if none is known.
+    """
+    host = os.environ.get('RCON_HOST')
+    if host:
+        return host
+    discovery = from_environment()
+    if discovery is not None:
+        return discovery.host(wait)
+    host = os.environ.get('MINECRAFT_NLB_DNS_NAME')
+    if host:
+        return host
+    raise LookupError("Set RCON_HOST, or ECS_CLUSTER and ECS_SERVICE")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the private IPs of an ECS service's running tasks.")
+    parser.add_argument('--cluster', default=os.environ.get('ECS_CLUSTER'))
+    parser.add_argument('--service', default=os.environ.get('ECS_SERVICE'))
+    parser.add_argument('--endpoint-url', default=os.environ.get('ECS_ENDPOINT_URL'))
+    parser.add_argument('--refresh', action='store_true', help="Ask ECS even if the cache is fresh.")
+    args = parser.parse_args(argv)
+    if not args.cluster or not args.service:
+        parser.error("Set the cluster and service with --cluster and --service, or ECS_CLUSTER and ECS_SERVICE")
+
+    discovery = EcsDiscovery(args.cluster, args.service, endpoint_url=args.endpoint_url)
+    ips = discovery.refresh() if args.refresh else discovery.hosts()
+    for ip in ips:
+        print(ip)
+    return 0 if ips else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
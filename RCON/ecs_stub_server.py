@@ -0,0 +1,169 @@
+"""
+A local stand-in for the parts of the ECS API that ecs_discovery.py uses.
+
+It answers ListTasks, paged like the real service, and DescribeTasks over
+the AWS JSON protocol, so a real boto3 client pointed at it with
+endpoint_url works unchanged. Tasks are added and removed by the test, and
+every call is recorded:
+
+    server = StubEcsServer(page_size=2).start()
+    server.add_task('cluster', 'minecraft', '10.0.0.5')
+    discovery = EcsDiscovery('cluster', 'minecraft', endpoint_url=server.endpoint_url, region_name='us-west-2')
+    print(discovery.hosts(), server.calls)
+
+boto3 still signs its requests, so set any AWS_ACCESS_KEY_ID and
+AWS_SECRET_ACCESS_KEY. From the command line it serves one running task:
+
+    python -m RCON.ecs_stub_server --port 4566 --cluster c --service s --ip 10.0.0.5
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TARGET_PREFIX = 'AmazonEC2ContainerServiceV20141113.'
+
+logger = logging.getLogger(__name__)
+
+
+class _EcsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        stub = self.server.stub
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        operation = self.headers.get('X-Amz-Target', '').replace(TARGET_PREFIX, '')
+        stub.calls.append(operation)
+        if stub.delay:
+            time.sleep(stub.delay)
+        handler = {'ListTasks': stub.list_tasks, 'DescribeTasks': stub.describe_tasks}.get(operation)
+        if stub.fail:
+            status, result = 500, {'__type': 'ServerException', 'message': "The stand-in is set to fail"}
+        elif handler is None:
+            status, result = 400, {'__type': 'InvalidParameterException', 'message': f"Unsupported operation {operation}"}
+        else:
+            status, result = handler(body)
+        data = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/x-amz-json-1.1')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubEcsServer:
+    """
+    Serves ListTasks and DescribeTasks on a local port.
+
+    Args:
+        host (str): Address to listen on.
+        port (int): Port to listen on. 0 picks a free port.
+        page_size (int): Most task ARNs returned per ListTasks page.
+        delay (float): Seconds to wait before each answer, to simulate the
+            latency of the real API.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, page_size=100, delay=0):
+        self.host = host
+        self.port = port
+        self.page_size = page_size
+        self.delay = delay
+        self.fail = False
+        self.calls = []
+        # task ARN -> task description
+        self.tasks = {}
+        self._ids = itertools.count(1)
+        self._server = None
+
+    @property
+    def endpoint_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), _EcsRequestHandler)
+        self._server.stub = self
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="ecs-stub", daemon=True).start()
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_task(self, cluster, service, ip, status='RUNNING'):
+        """Adds a task with one network interface. Returns its ARN."""
+        arn = f"arn:aws:ecs:us-west-2:000000000000:task/{cluster}/{next(self._ids):032x}"
+        self.tasks[arn] = {
+            'taskArn': arn,
+            'clusterArn': cluster,
+            'group': f"service:{service}",
+            'lastStatus': status,
+            'desiredStatus': 'RUNNING' if status != 'STOPPED' else 'STOPPED',
+            'startedAt': time.time(),
+            'attachments': [{
+                'type': 'ElasticNetworkInterface',
+                'status': 'ATTACHED',
+                'details': [
+                    {'name': 'subnetId', 'value': 'subnet-00000000'},
+                    {'name': 'privateIPv4Address', 'value': ip},
+                ],
+            }],
+        }
+        return arn
+
+    def remove_task(self, arn):
+        self.tasks.pop(arn, None)
+
+    def list_tasks(self, body):
+        arns = [
+            arn for arn, task in self.tasks.items()
+            if task['clusterArn'] == body.get('cluster', 'default')
+            and ('serviceName' not in body or task['group'] == f"service:{body['serviceName']}")
+            and ('desiredStatus' not in body or task['desiredStatus'] == body['desiredStatus'])
+        ]
+        start = int(body.get('nextToken') or 0)
+        page_size = min(self.page_size, body.get('maxResults', self.page_size))
+        result = {'taskArns': arns[start:start + page_size]}
+        if start + page_size < len(arns):
+            result['nextToken'] = str(start + page_size)
+        return 200, result
+
+    def describe_tasks(self, body):
+        requested = body.get('tasks', [])
+        if len(requested) > 100:
+            return 400, {'__type': 'InvalidParameterException', 'message': "Tasks cannot be more than 100"}
+        return 200, {
+            'tasks': [self.tasks[arn] for arn in requested if arn in self.tasks],
+            'failures': [{'arn': arn, 'reason': 'MISSING'} for arn in requested if arn not in self.tasks],
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the ECS task API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4566)
+    parser.add_argument('--cluster', required=True)
+    parser.add_argument('--service', required=True)
+    parser.add_argument('--ip', action='append', default=[], help="Private IP of a running task. Repeat for more tasks.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    server = StubEcsServer(args.host, args.port).start()
+    for ip in args.ip:
+        server.add_task(args.cluster, args.service, ip)
+    logger.info(f"Stand-in ECS API listening on {server.endpoint_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,24 @@
-import boto3
-import json
+import os
 
-# Constants: Set these to match your specific environment
-CLUSTER_NAME = 'MinecraftStack-MinecraftServerClusterE5F7E9E1-isYIDqj5eWpL'
-SERVICE_NAME = 'MinecraftStack-MinecraftServerServiceB09FCDC8-x1P4TO8cu4Dp'
+from .ecs_discovery import EcsDiscovery
 
-def get_container_ip(cluster_name, service_name):
-    # Create a boto3 client for ECS
-    ecs_client = boto3.client('ecs')
+# Constants: Set these to match your specific environment, or set ECS_CLUSTER
+# and ECS_SERVICE.
+CLUSTER_NAME = os.environ.get('ECS_CLUSTER', 'MinecraftStack-MinecraftServerClusterE5F7E9E1-isYIDqj5eWpL')
+SERVICE_NAME = os.environ.get('ECS_SERVICE', 'MinecraftStack-MinecraftServerServiceB09FCDC8-x1P4TO8cu4Dp')
 
-    # Get the list of tasks running under the specified service and cluster
-    tasks_response = ecs_client.list_tasks(
-        cluster=cluster_name,
-        serviceName=service_name
-    )
-    task_arns = tasks_response.get('taskArns')
-    if not task_arns:
-        raise Exception("No tasks found under the specified service.")
-
-    # Describe the task to get container instance ID
-    describe_tasks_response = ecs_client.describe_tasks(
-        cluster=cluster_name,
-        tasks=task_arns
-    )
-    tasks = describe_tasks_response.get('tasks')
-    if not tasks:
-        raise Exception("Unable to retrieve task details.")
+def get_container_ips(cluster_name, service_name, **kwargs):
+    # Every running task of the service, from the discovery cache when it is
+    # fresh. kwargs are passed to EcsDiscovery, e.g. endpoint_url.
+    return EcsDiscovery(cluster_name, service_name, **kwargs).hosts()
 
-    details = tasks[0]['attachments'][0]['details']
-    for detail in details: 
-        if detail['name'] == 'privateIPv4Address':
-            return detail['value']
-    return False
+def get_container_ip(cluster_name, service_name, **kwargs):
+    ips = get_container_ips(cluster_name, service_name, **kwargs)
+    if not ips:
+        raise Exception("No tasks found under the specified service.")
+    return ips[0]
 
 # Usage
 if __name__ == "__main__":
-    ip_address = get_container_ip(CLUSTER_NAME, SERVICE_NAME)
-    print(f"The IP address of the container is: {ip_address}")
-
+    for ip_address in get_container_ips(CLUSTER_NAME, SERVICE_NAME):
+        print(f"The IP address of the container is: {ip_address}")
@@ -1,12 +1,18 @@
-from mcrcon import MCRcon
+import asyncio
 import os
 
-server = '10.0.149.21'
+from .ecs_discovery import resolve_rcon_host
+from .rcon_client import RconClient
+
+server = resolve_rcon_host()
 port = os.environ['MINECRAFT_SERVER_PORT_RCON']
 password = os.environ['RCON_PASSWORD']
 
-with MCRcon(server, password, port=int(port)) as mcr:
-	resp = mcr.command("/op mikegchambers")
-	print(resp)
-	resp = mcr.command("/op deekob")
-	print(resp)
\ No newline at end of file
+
+async def main():
+	async with RconClient(server, int(port), password) as rcon:
+		# The commands are sent together instead of one after the other.
+		for resp in await rcon.batch(["/op mikegchambers", "/op deekob"]):
+			print(resp)
+
+asyncio.run(main())
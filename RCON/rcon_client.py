@@ -0,0 +1,336 @@
+"""
+An asyncio client for the Minecraft RCON protocol.
+
+Opening an RCON connection costs a TCP handshake and a login round trip, so
+running admin commands one script and one MCRcon connection at a time is
+slow. RconClient instead keeps a small pool of logged-in connections open
+and, on each connection, pipelines commands: every command is written
+straight away with its own request id, and responses are matched to their
+commands by id as they come back. Dropped connections are reopened on the
+next command.
+
+    async with RconClient(host, port, password) as rcon:
+        print(await rcon.command("time set noon"))
+        responses = await rcon.batch(["op alice", "op bob"])
+
+It can also be used from the command line, from the repository root:
+
+    python -m RCON.rcon_client --host 10.0.0.5 "time set noon" "weather clear"
+    python -m RCON.rcon_client --host 10.0.0.5 -f commands.txt
+
+The password is read from RCON_PASSWORD and the port from
+MINECRAFT_SERVER_PORT_RCON. Unless given, the host is RCON_HOST or else found
+through ECS, see ecs_discovery.py.
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import struct
+import sys
+
+# Packet types.
+TYPE_RESPONSE = 0
+TYPE_COMMAND = 2
+TYPE_AUTH_RESPONSE = 2
+TYPE_LOGIN = 3
+
+# The server splits responses into packets with at most this much payload.
+MAX_RESPONSE_PAYLOAD = 4096
+# The server refuses packets with more than this much payload.
+MAX_COMMAND_PAYLOAD = 1446
+
+_HEADER = struct.Struct('<iii')
+
+logger = logging.getLogger(__name__)
+
+
+class RconError(Exception):
+    """Raised when the server rejects a request or the connection fails."""
+
+
+class RconAuthError(RconError):
+    """Raised when the server refuses the RCON password."""
+
+
+def encode_packet(request_id, packet_type, payload):
+    """Returns the bytes of one RCON packet. The payload may be text or bytes."""
+    body = payload if isinstance(payload, bytes) else payload.encode('utf-8')
+    return _HEADER.pack(len(body) + 10, request_id, packet_type) + body + b'\x00\x00'
+
+
+async def read_packet(reader):
+    """Reads one packet and returns (request_id, packet_type, payload bytes)."""
+    (length,) = struct.unpack('<i', await reader.readexactly(4))
+    data = await reader.readexactly(length)
+    request_id, packet_type = struct.unpack('<ii', data[:8])
+    return request_id, packet_type, data[8:-2]
+
+
+class RconConnection:
+    """
+    One logged-in RCON connection that pipelines commands.
+
+    Args:
+        host: Server address, or a callable returning it, which is called
+            on every connect so a moved server is found again.
+        port (int): RCON port.
+        password (str): RCON password.
+        timeout (float): Seconds to wait for the connection, login and each
+            response.
+    """
+
+    def __init__(self, host, port, password, timeout=10):
+        self.host = host
+        self.address = None if callable(host) else host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._ids = itertools.count(1)
+        # request id -> [future, response fragments]
+        self._pending = {}
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    async def connect(self):
+        """Opens the connection and logs in."""
+        if callable(self.host):
+            # The resolver may block, e.g. to ask ECS on a cold cache.
+            self.address = await asyncio.get_running_loop().run_in_executor(None, self.host)
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.address, self.port), self.timeout
+        )
+        request_id = next(self._ids)
+        try:
+            self._writer.write(encode_packet(request_id, TYPE_LOGIN, self.password))
+            await self._writer.drain()
+            while True:
+                response_id, packet_type, _ = await asyncio.wait_for(read_packet(self._reader), self.timeout)
+                # Some servers send an empty response before the login result.
+                if packet_type == TYPE_AUTH_RESPONSE:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self._abort()
+            raise RconError(f"Connection closed during login: {e}")
+        except BaseException:
+            self._abort()
+            raise
+        if response_id == -1:
+            self._abort()
+            raise RconAuthError("The server refused the RCON password")
+        self._reader_task = asyncio.ensure_future(self._read_responses())
+        logger.info(f"RCON connected to {self.address}:{self.port}")
+
+    async def command(self, command):
+        """Sends a command and returns the server's response text."""
+        if not self.connected:
+            raise RconError("Not connected")
+        if len(command.encode('utf-8')) > MAX_COMMAND_PAYLOAD:
+            raise RconError(f"Command is longer than {MAX_COMMAND_PAYLOAD} bytes")
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = [future, []]
+        try:
+            self._writer.write(encode_packet(request_id, TYPE_COMMAND, command))
+            await self._writer.drain()
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise RconError(f"No response to {command!r} within {self.timeout}s")
+        except ConnectionError as e:
+            self._abort(e)
+            raise RconError(f"Connection lost: {e}")
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def close(self):
+        self._abort()
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+
+    async def _read_responses(self):
+        try:
+            while True:
+                request_id, _, payload = await read_packet(self._reader)
+                # The server answers in order, so a response to a later
+                # request means every earlier one is complete.
+                for earlier_id in [pending_id for pending_id in self._pending if pending_id < request_id]:
+                    self._resolve(earlier_id)
+                entry = self._pending.get(request_id)
+                if entry is None:
+                    continue
+                entry[1].append(payload)
+                if len(payload) < MAX_RESPONSE_PAYLOAD:
+                    self._resolve(request_id)
+                else:
+                    # The response may go on in another packet. The server
+                    # answers an empty request with a packet of its own,
+                    # which marks the end of this one.
+                    self._writer.write(encode_packet(next(self._ids), TYPE_RESPONSE, ''))
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            self._abort(e)
+        except asyncio.CancelledError:
+            self._abort()
+            raise
+
+    def _resolve(self, request_id):
+        entry = self._pending.pop(request_id, None)
+        if entry is not None and not entry[0].done():
+            # Fragments can split a character, so they are joined first.
+            entry[0].set_result(b''.join(entry[1]).decode('utf-8', errors='replace'))
+
+    def _abort(self, error=None):
+        if self._writer is not None:
+            self._writer.close()
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.set_exception(RconError(f"Connection lost: {error}" if error else "Connection closed"))
+        self._pending.clear()
+        if self._reader_task is not None and self._reader_task is not asyncio.current_task():
+            self._reader_task.cancel()
+
+
+class RconClient:
+    """
+    A pool of RCON connections to one server.
+
+    Args:
+        host: Server address, or a callable returning it.
+        port (int): RCON port.
+        password (str): RCON password.
+        pool_size (int): Connections to keep open.
+        max_in_flight (int): Commands pipelined on one connection at once.
+        timeout (float): Seconds to wait for the connection and each response.
+        retries (int): Times a command is retried on a new connection when
+            its connection fails. The command may already have run, so only
+            retry commands that are safe to repeat.
+    """
+
+    def __init__(self, host, port, password, pool_size=2, max_in_flight=32, timeout=10, retries=1):
+        self.host = host
+        self.port = int(port)
+        self.password = password
+        self.pool_size = pool_size
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.retries = retries
+        self._connections = [RconConnection(host, self.port, password, timeout) for _ in range(pool_size)]
+        # Commands assigned to each connection, including those waiting for
+        # it to connect.
+        self._load = [0] * pool_size
+        self._connecting = {}
+        self._slots = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def command(self, command):
+        """Runs one command and returns the server's response text."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size * self.max_in_flight)
+        async with self._slots:
+            for attempt in range(self.retries + 1):
+                # The least busy connection, preferring ones already open.
+                index = min(range(self.pool_size), key=lambda i: (self._load[i], not self._connections[i].connected))
+                connection = self._connections[index]
+                self._load[index] += 1
+                try:
+                    await self._connect(connection)
+                    return await connection.command(command)
+                except RconAuthError:
+                    raise
+                except RconError as e:
+                    if connection.connected or attempt == self.retries:
+                        raise
+                    logger.warning(f"RCON connection failed, retrying {command!r}: {e}")
+                finally:
+                    self._load[index] -= 1
+                await asyncio.sleep(min(0.2 * 2 ** attempt, 2))
+
+    async def batch(self, commands):
+        """
+        Runs many commands, pipelined across the pool.
+
+        Returns:
+            list: The responses, in the order of the commands. A command that
+                failed has its RconError in its place.
+        """
+        return await asyncio.gather(*(self.command(command) for command in commands), return_exceptions=True)
+
+    async def close(self):
+        await asyncio.gather(*(connection.close() for connection in self._connections))
+
+    async def _connect(self, connection):
+        """Connects a connection of the pool unless it is already open."""
+        if connection.connected:
+            return
+        # Several commands may find the same connection closed; only the
+        # first one connects it.
+        pending = self._connecting.get(id(connection))
+        if pending is None:
+            pending = self._connecting[id(connection)] = asyncio.ensure_future(connection.connect())
+            pending.add_done_callback(lambda _: self._connecting.pop(id(connection), None))
+        try:
+            await asyncio.shield(pending)
+        except (OSError, LookupError, asyncio.TimeoutError) as e:
+            raise RconError(f"Could not connect to {connection.address or 'the server'}:{self.port}: {e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Minecraft server commands over RCON.")
+    parser.add_argument('commands', nargs='*', help="Commands to run, e.g. \"time set noon\".")
+    parser.add_argument('-f', '--file', help="Read commands from a file, one per line. Use - for stdin.")
+    parser.add_argument('--host', help="Server address. Defaults to RCON_HOST, or the server found through ECS.")
+    parser.add_argument('--port', type=int, default=int(os.environ.get('MINECRAFT_SERVER_PORT_RCON', 25575)))
+    parser.add_argument('--pool-size', type=int, default=2)
+    parser.add_argument('--timeout', type=float, default=10)
+    args = parser.parse_args(argv)
+
+    password = os.environ.get('RCON_PASSWORD')
+    if password is None:
+        parser.error("Set the password with RCON_PASSWORD")
+    if not args.host:
+        from .ecs_discovery import resolve_rcon_host
+        try:
+            args.host = resolve_rcon_host()
+        except LookupError as e:
+            parser.error(f"Set the host with --host: {e}")
+
+    commands = list(args.commands)
+    if args.file:
+        lines = sys.stdin if args.file == '-' else open(args.file)
+        with lines:
+            commands.extend(line.strip() for line in lines if line.strip() and not line.startswith('#'))
+    if not commands:
+        parser.error("No commands given")
+
+    async def run():
+        async with RconClient(args.host, args.port, password, pool_size=args.pool_size, timeout=args.timeout) as rcon:
+            return await rcon.batch(commands)
+
+    failed = 0
+    for response in asyncio.run(run()):
+        if isinstance(response, Exception):
+            failed += 1
+            print(f"error: {response}", file=sys.stderr)
+        else:
+            print(response)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
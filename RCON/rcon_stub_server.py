@@ -0,0 +1,128 @@
+"""
+A local stand-in for a Minecraft server's RCON port.
+
+It speaks the same protocol as the vanilla server: a login packet, command
+packets answered in order with the request id, responses split into 4096
+byte packets, and "Unknown request" for any other packet type. Commands are
+recorded and answered by a handler, so RCON tools can be tried out without a
+Minecraft server.
+
+    server = await StubRconServer('secret').start()
+    async with RconClient('127.0.0.1', server.port, 'secret') as rcon:
+        await rcon.command("time set noon")
+    print(server.commands)
+
+From the command line it echoes every command back:
+
+    python -m RCON.rcon_stub_server --port 25575 --password secret
+"""
+
+import argparse
+import asyncio
+import logging
+
+from .rcon_client import MAX_RESPONSE_PAYLOAD, TYPE_AUTH_RESPONSE, TYPE_COMMAND, TYPE_LOGIN, TYPE_RESPONSE, encode_packet, read_packet
+
+logger = logging.getLogger(__name__)
+
+
+def echo(command):
+    return f"Ran: {command}"
+
+
+class StubRconServer:
+    """
+    Serves RCON on a local port.
+
+    Args:
+        password (str): The password clients must log in with.
+        handler: Callable handler(command) returning the response text.
+            Defaults to echoing the command.
+        host (str): Address to listen on.
+        port (int): Port to listen on. 0 picks a free port.
+        delay (float): Seconds to wait before answering each command, to
+            simulate a busy or distant server.
+    """
+
+    def __init__(self, password, handler=echo, host='127.0.0.1', port=0, delay=0):
+        self.password = password
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.commands = []
+        self.connections = 0
+        self._server = None
+        self._writers = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        """Stops listening and drops every open connection."""
+        self.drop_connections()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def drop_connections(self):
+        """Closes the open connections, as a server restart would."""
+        for writer in list(self._writers):
+            writer.close()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        self._writers.add(writer)
+        logged_in = False
+        try:
+            while True:
+                request_id, packet_type, payload = await read_packet(reader)
+                text = payload.decode('utf-8', errors='replace')
+                if packet_type == TYPE_LOGIN:
+                    logged_in = text == self.password
+                    writer.write(encode_packet(request_id if logged_in else -1, TYPE_AUTH_RESPONSE, ''))
+                elif not logged_in:
+                    break
+                elif packet_type == TYPE_COMMAND:
+                    if self.delay:
+                        await asyncio.sleep(self.delay)
+                    self.commands.append(text)
+                    self._respond(writer, request_id, self.handler(text))
+                else:
+                    self._respond(writer, request_id, f"Unknown request {packet_type:x}")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _respond(self, writer, request_id, text):
+        data = text.encode('utf-8')
+        for start in range(0, max(len(data), 1), MAX_RESPONSE_PAYLOAD):
+            writer.write(encode_packet(request_id, TYPE_RESPONSE, data[start:start + MAX_RESPONSE_PAYLOAD]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local stand-in RCON server that echoes commands.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=25575)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--delay', type=float, default=0, help="Seconds to wait before each response.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    async def run():
+        server = await StubRconServer(args.password, host=args.host, port=args.port, delay=args.delay).start()
+        logger.info(f"Stand-in RCON server listening on {args.host}:{server.port}")
+        await server._server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
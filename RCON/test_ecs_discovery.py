@@ -0,0 +1,105 @@
+import json
+import time
+
+import boto3
+import pytest
+from botocore.config import Config
+
+from RCON.ecs_discovery import EcsDiscovery
+from RCON.ecs_stub_server import StubEcsServer
+
+
+@pytest.fixture
+def server():
+    server = StubEcsServer(page_size=2).start()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client(server):
+    # The stand-in needs signed requests but not real credentials. Failures
+    # are not retried so the tests stay fast.
+    return boto3.client(
+        'ecs', endpoint_url=server.endpoint_url, region_name='us-west-2',
+        aws_access_key_id='test', aws_secret_access_key='test',
+        config=Config(retries={'total_max_attempts': 1}),
+    )
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting")
+        time.sleep(0.01)
+
+
+def test_lists_every_page_of_running_tasks(server, client):
+    for i in range(5):
+        server.add_task('cluster', 'minecraft', f'10.0.0.{i}')
+    server.add_task('cluster', 'minecraft', '10.0.1.1', status='PROVISIONING')
+    server.add_task('cluster', 'minecraft', '10.0.1.2', status='STOPPED')
+    server.add_task('cluster', 'other', '10.0.2.1')
+
+    discovery = EcsDiscovery('cluster', 'minecraft', client=client, cache_path=None)
+
+    assert discovery.hosts() == [f'10.0.0.{i}' for i in range(5)]
+    # Six RUNNING-desired tasks over pages of two.
+    assert server.calls.count('ListTasks') == 3
+    assert server.calls.count('DescribeTasks') == 1
+
+
+def test_fresh_answer_is_served_from_cache(server, client, tmp_path):
+    server.add_task('cluster', 'minecraft', '10.0.0.1')
+    cache_path = str(tmp_path / 'hosts.json')
+    EcsDiscovery('cluster', 'minecraft', client=client, cache_path=cache_path).hosts()
+    calls = len(server.calls)
+
+    discovery = EcsDiscovery('cluster', 'minecraft', client=client, cache_path=cache_path)
+
+    assert discovery.hosts() == ['10.0.0.1']
+    assert len(server.calls) == calls
+    with open(cache_path) as f:
+        assert json.load(f)['cluster/minecraft']['ips'] == ['10.0.0.1']
+
+
+def test_stale_answer_is_served_while_it_refreshes(server, client):
+    server.add_task('cluster', 'minecraft', '10.0.0.1')
+    discovery = EcsDiscovery('cluster', 'minecraft', ttl=0, client=client, cache_path=None)
+    assert discovery.hosts() == ['10.0.0.1']
+
+    server.add_task('cluster', 'minecraft', '10.0.0.2')
+    server.delay = 0.2
+    started = time.monotonic()
+
+    assert discovery.hosts() == ['10.0.0.1']
+    assert time.monotonic() - started < server.delay
+    wait_for(lambda: discovery.hosts(wait=False) == ['10.0.0.1', '10.0.0.2'])
+
+
+def test_failed_refresh_keeps_the_cached_answer(server, client):
+    server.add_task('cluster', 'minecraft', '10.0.0.1')
+    discovery = EcsDiscovery('cluster', 'minecraft', ttl=0, client=client, cache_path=None)
+    discovery.hosts()
+    server.fail = True
+
+    calls = len(server.calls)
+    assert discovery.hosts() == ['10.0.0.1']
+    wait_for(lambda: len(server.calls) > calls)
+    assert discovery.host() == '10.0.0.1'
+
+
+def test_falls_back_when_ecs_has_no_address(server, client):
+    server.fail = True
+    discovery = EcsDiscovery('cluster', 'minecraft', fallback='nlb.example.com', client=client, cache_path=None)
+    assert discovery.host() == 'nlb.example.com'
+
+    # No running tasks.
+    server.fail = False
+    assert discovery.refresh() == []
+    assert discovery.host() == 'nlb.example.com'
+
+    discovery.fallback = None
+    with pytest.raises(LookupError):
+        discovery.host()
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from RCON.rcon_client import MAX_RESPONSE_PAYLOAD, RconAuthError, RconClient, RconError
+from RCON.rcon_stub_server import StubRconServer, echo
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+def test_command_returns_response():
+    async def scenario():
+        server = await StubRconServer('secret').start()
+        async with RconClient('127.0.0.1', server.port, 'secret') as rcon:
+            response = await rcon.command("time set noon")
+        await server.close()
+        return response, server.commands
+
+    response, commands = run(scenario())
+    assert response == "Ran: time set noon"
+    assert commands == ["time set noon"]
+
+
+def test_batch_is_pipelined_on_one_connection():
+    async def scenario():
+        in_flight = []
+
+        def handler(command):
+            in_flight.append(rcon._connections[0].in_flight)
+            return echo(command)
+
+        server = await StubRconServer('secret', handler=handler).start()
+        rcon = RconClient('127.0.0.1', server.port, 'secret', pool_size=1)
+        responses = await rcon.batch([f"say {i}" for i in range(20)])
+        await rcon.close()
+        await server.close()
+        return responses, in_flight, server.connections
+
+    responses, in_flight, connections = run(scenario())
+    assert responses == [f"Ran: say {i}" for i in range(20)]
+    assert connections == 1
+    # Every command was written before the server answered the first one.
+    assert in_flight[0] == 20
+
+
+@pytest.mark.parametrize('response', [
+    'x' * MAX_RESPONSE_PAYLOAD,
+    'x' * (MAX_RESPONSE_PAYLOAD * 2 + 5),
+    # Two byte characters, so fragments split a character in half.
+    'é' * 5000,
+], ids=['one-full-packet', 'three-packets', 'split-characters'])
+def test_long_responses_are_reassembled(response):
+    async def scenario():
+        server = await StubRconServer('secret', handler=lambda command: response if command == 'long' else echo(command)).start()
+        async with RconClient('127.0.0.1', server.port, 'secret', pool_size=1) as rcon:
+            results = await rcon.batch(['before', 'long', 'after'])
+        await server.close()
+        return results
+
+    assert run(scenario()) == ['Ran: before', response, 'Ran: after']
+
+
+def test_reconnects_after_connection_drops():
+    async def scenario():
+        server = await StubRconServer('secret').start()
+        async with RconClient('127.0.0.1', server.port, 'secret', pool_size=1) as rcon:
+            first = await rcon.command("say one")
+            server.drop_connections()
+            second = await rcon.command("say two")
+        await server.close()
+        return first, second, server.connections
+
+    first, second, connections = run(scenario())
+    assert (first, second) == ("Ran: say one", "Ran: say two")
+    assert connections == 2
+
+
+def test_wrong_password_raises_auth_error():
+    async def scenario():
+        server = await StubRconServer('secret').start()
+        try:
+            async with RconClient('127.0.0.1', server.port, 'wrong') as rcon:
+                with pytest.raises(RconAuthError):
+                    await rcon.command("say hi")
+        finally:
+            await server.close()
+        return server.commands, server.connections
+
+    commands, connections = run(scenario())
+    assert commands == []
+    # A refused password is not retried.
+    assert connections == 1
+
+
+def test_server_down_raises_rcon_error():
+    async def scenario():
+        server = await StubRconServer('secret').start()
+        await server.close()
+        async with RconClient('127.0.0.1', server.port, 'secret', timeout=1, retries=0) as rcon:
+            with pytest.raises(RconError):
+                await rcon.command("say hi")
+
+    run(scenario())
@@ -0,0 +1,204 @@
+"""
+This module declares the actions the agent can call and how their
+parameters are decoded.
+
+Each action method is marked with the @action decorator, which records its
+description, whether it only reads game state, how long its result may be
+cached, and a Param for every parameter. The decoders are chosen once, when the decorator runs, so a call
+only looks the action up in a dict and runs the decoders. The same
+declarations produce the function schema for the Bedrock action group, so
+the schema and the code cannot drift apart.
+"""
+
+import json
+import math
+from collections import namedtuple
+
+
+def _decode_number(value):
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{value!r} is not a finite number")
+    return number
+
+
+def _decode_integer(value):
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    # The agent sometimes writes whole numbers as 3.0 or 1e3.
+    number = _decode_number(value)
+    if not number.is_integer():
+        raise ValueError(f"{value!r} is not a whole number")
+    return int(number)
+
+
+# Bedrock action group parameter types and how their string values decode.
+_DECODERS = {
+    'string': str,
+    'number': _decode_number,
+    'integer': _decode_integer,
+    'boolean': lambda value: value if isinstance(value, bool) else str(value).strip().lower() in ('true', '1', 'yes'),
+    'array': lambda value: value if isinstance(value, list) else json.loads(value),
+}
+
+
+class ParameterError(ValueError):
+    """Raised when a parameter is missing or has an invalid value."""
+
+
+class Param:
+    """
+    Declares one action parameter.
+
+    Args:
+        name (str): Parameter name, as sent by the agent.
+        type (str): One of string, number, integer, boolean or array.
+        description (str): Description shown to the agent.
+        required (bool): Whether the agent must supply the parameter.
+        default: Value used when an optional parameter is not supplied.
+        minimum, maximum: Inclusive bounds for number and integer parameters.
+            Values outside them are refused with a ParameterError, and the
+            bounds are added to the description the agent sees.
+        parse: Optional callable that replaces the type's decoder.
+    """
+
+    def __init__(self, name, type='string', description='', required=True, default=None,
+                 minimum=None, maximum=None, parse=None):
+        if type not in _DECODERS:
+            raise ValueError(f"Unknown parameter type: {type}")
+        self.name = name
+        self.type = type
+        self.description = description
+        self.required = required
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self._parse = parse or _DECODERS[type]
+        if default is not None and not self.in_bounds(default):
+            raise ValueError(f"Default of {name} is out of bounds: {default}")
+
+    def decode(self, value):
+        """Converts the agent's value and checks it against the bounds."""
+        try:
+            value = self._parse(value)
+        except (TypeError, ValueError, OverflowError) as e:
+            raise ParameterError(f"Invalid value for {self.name}: {e}")
+        if self.type == 'array' and not isinstance(value, list):
+            raise ParameterError(f"{self.name} must be a list")
+        if self.minimum is not None and value < self.minimum:
+            raise ParameterError(f"{self.name} must be at least {self.minimum}")
+        if self.maximum is not None and value > self.maximum:
+            raise ParameterError(f"{self.name} must be at most {self.maximum}")
+        return value
+
+    def in_bounds(self, value):
+        return (self.minimum is None or value >= self.minimum) and (self.maximum is None or value <= self.maximum)
+
+    def schema(self):
+        description = self.description
+        if self.minimum is not None and self.maximum is not None:
+            description += f" From {self.minimum} to {self.maximum}."
+        elif self.minimum is not None:
+            description += f" At least {self.minimum}."
+        elif self.maximum is not None:
+            description += f" At most {self.maximum}."
+        return {'description': description, 'type': self.type, 'required': self.required}
+
+
+ActionSpec = namedtuple('ActionSpec', ['name', 'description', 'params', 'read_only', 'cache_ttl'])
+
+
+def action(description, *params, read_only=False, cache_ttl=None):
+    """
+    Marks a FunctionHandler method as an action the agent can call.
+
+    Args:
+        read_only (bool): The action only reads game state, so it may run
+            alongside other read-only actions.
+        cache_ttl (float): Seconds its result may be served from the result
+            cache. Only read-only actions can be cached.
+    """
+    if cache_ttl and not read_only:
+        raise ValueError("Only read-only actions can be cached")
+
+    def decorator(func):
+        func.action_spec = ActionSpec(func.__name__, description, params, read_only, cache_ttl)
+        return func
+    return decorator
+
+
+class BoundAction:
+    """An action spec together with the method that implements it."""
+
+    def __init__(self, spec, func):
+        self.spec = spec
+        self.func = func
+        self.read_only = spec.read_only
+        self.cache_ttl = spec.cache_ttl
+        self._params = {param.name: param for param in spec.params}
+
+    def decode(self, parameters):
+        """
+        Decodes the agent's parameter list into a dict of typed values.
+
+        Args:
+            parameters (list): [{'name': ..., 'value': ...}] entries.
+        """
+        raw = {entry.get('name'): entry.get('value') for entry in parameters}
+        decoded = {}
+        for name, param in self._params.items():
+            if raw.get(name) in (None, ''):
+                if param.required:
+                    raise ParameterError(f"Missing parameter: {name}")
+                decoded[name] = param.default
+            else:
+                decoded[name] = param.decode(raw[name])
+        return decoded
+
+
+def collect_actions(handler_class):
+    """Returns the ActionSpec of every @action method of a class, by method name."""
+    actions = {}
+    for name in dir(handler_class):
+        spec = getattr(getattr(handler_class, name), 'action_spec', None)
+        if spec is not None:
+            actions[name] = spec
+    return actions
+
+
+def function_schema(handler_class):
+    """Returns the functionSchema of a Bedrock action group for a class's actions."""
+    return {
+        'functions': [
+            {
+                'name': spec.name,
+                'description': spec.description,
+                'parameters': {param.name: param.schema() for param in spec.params},
+                'requireConfirmation': 'DISABLED',
+            }
+            for spec in collect_actions(handler_class).values()
+        ]
+    }
+
+
+class ActionRegistry:
+    """
+    The actions of a handler object, keyed by name.
+
+    Args:
+        handler: Object whose @action methods are registered.
+    """
+
+    def __init__(self, handler):
+        self.actions = {
+            spec.name: BoundAction(spec, getattr(handler, name))
+            for name, spec in collect_actions(type(handler)).items()
+        }
+
+    def get(self, name):
+        return self.actions.get(name)
@@ -1,12 +1,26 @@
-import boto3, json, time
-import logging, sys
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(name)s %(levelname)s: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    stream=sys.stdout
-)
+import asyncio, json, math, os, time
+import logging
+import numpy as np
+import metrics
+from action_registry import ActionRegistry, Param, ParameterError, action, function_schema
+from bedrock_transport import BedrockTransport
+from chat_scheduler import PRIORITY_HIGH, PRIORITY_NORMAL, ChatScheduler
+from chat_stream import ChatStreamer
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from javascript import On
+from dig_planner import DigPlanner
+from entity_index import EntityIndex
+from fill_planner import FILL_MODES, MAX_EDIT_VOLUME, check_block, cuboid_volume, fill_commands, mask_from_points, merge_cuboids
+from intent_router import ROUTE_FAILED, ROUTE_HIT
+from movement import MOVE_NO_PATH, MOVE_REACHED, MovementController
+from path_cache import PathCache
+from result_cache import ResultCache
+from schematic import SCHEMATIC_EXTENSIONS, compile_commands, open_schematic
+from structured_logging import LazyJson
+from world_cache import WorldCache
+from waypoints import WaypointGraph
+from world_query import WorldQuery
 
 # class TestPlayerBot:
 #     def chat(self, message):
@@ -15,38 +29,114 @@ logging.basicConfig(
 #     def jump(self):
 #         self.logger.info(f"pLayerBot is jumping")
 
+# States of a conversation turn, see BedrockBot._run_turn.
+TURN_INVOKE = "invoke"
+TURN_RETURN_CONTROL = "return_control"
+TURN_DONE = "done"
+TURN_EXHAUSTED = "step_budget_exhausted"
+TURN_TIMED_OUT = "timed_out"
+TURN_FINAL_STATES = (TURN_DONE, TURN_EXHAUSTED, TURN_TIMED_OUT)
+
+# Keep action results well inside the agent's 25 KB response body limit.
+MAX_RESPONSE_CHARS = 20000
+
+# No block coordinate is farther from 0 than this, the largest world border.
+MAX_COORDINATE = 30_000_000
+
+def parse_location(value):
+    """
+    Parses one [x,y,z] location, given as a list or as JSON text.
+
+    Returns:
+        list: The three coordinates as floats.
+    """
+    if not isinstance(value, list):
+        value = json.loads(value)
+    try:
+        point = np.asarray(value, dtype=float)
+    except (TypeError, ValueError):
+        point = None
+    if point is None or point.shape != (3,):
+        raise ParameterError("A location must be a list of three numbers [x,y,z]")
+    if not np.isfinite(point).all() or np.abs(point).max() > MAX_COORDINATE:
+        raise ParameterError(f"Location coordinates must be finite numbers within {MAX_COORDINATE}")
+    return point.tolist()
+
+def parse_points(text):
+    """
+    Parses a JSON list of [x,y,z] points, or an object of name: [x,y,z].
+
+    Returns:
+        tuple: The point names and an (N, 3) float array of the points.
+            Points in a list are named by their index.
+    """
+    data = json.loads(text)
+    if isinstance(data, dict):
+        names, values = list(data), list(data.values())
+    else:
+        names, values = [str(index) for index in range(len(data))], data
+    points = np.asarray(values, dtype=float)
+    if not len(points):
+        raise ParameterError("No locations given")
+    if points.ndim != 2 or points.shape[1] != 3 or len(names) != len(points):
+        raise ParameterError("Each location must be a list of three numbers [x,y,z]")
+    if not np.isfinite(points).all():
+        raise ParameterError("Locations must be finite numbers")
+    return names, points
+
 class FunctionHandler:
 
     def __init__(self, playerBot, pathfinder):
         self.logger = logging.getLogger(__name__)
         self.bot = playerBot
         self.pathfinder = pathfinder
+        self.world = WorldQuery(playerBot)
+        self.world_cache = WorldCache(playerBot)
+        self.entities = EntityIndex(playerBot)
+        self.path_cache = PathCache()
+        self.movement = MovementController(playerBot, pathfinder, path_cache=self.path_cache)
+        self.dig_planner = DigPlanner(playerBot, self.movement, world_cache=self.world_cache)
+        self.actions = ActionRegistry(self)
+        self.result_cache = ResultCache()
+        # An RconChannel to the server for bulk edits, or None without RCON.
+        self.rcon = None
+        # Where stored designs for action_build_schematic are kept.
+        self.schematic_dir = 'schematics'
+        # Callable notify(message, key) that tells players how a long action
+        # is going, or None. A newer notice with the same key replaces one
+        # that has not been sent yet.
+        self.notify = None
+        # Named places, and the known trips between them.
+        self.waypoints = WaypointGraph()
+        # How near a waypoint the bot or its goal must be for a move to be
+        # routed through the waypoints.
+        self.waypoint_radius = 8
+        # A cached player location is dropped once the player has moved this far.
+        self.location_threshold = 2.0
+        self._location_anchors = {}
+
+        @On(playerBot, 'rain')
+        def on_rain(this, *args):
+            self.result_cache.invalidate('action_is_raining')
+
+        self.entities.add_listener(self._on_entity_moved)
+        self.world_cache.add_listener(self._on_block_changed)
         
     """Handles specific actions that can be called dynamically."""
+    @action(
+        "Dig a square hole next to and below the bot.",
+        Param('width', 'integer', "Width and length of the hole in blocks.", minimum=1, maximum=16),
+        Param('depth', 'integer', "Depth of the hole in blocks.", minimum=1, maximum=16),
+    )
     def action_dig(self, parameters):
         self.logger.info("Digging")
         self.logger.info(parameters)
 
-        # Look in inventory
-        inventory_items = self.bot.inventory.items()
-
-        # # equip with pix axe (of any sort)
-        # loop through inventory and find the item with name that contains 'pickaxe'
-        for item in inventory_items:
-            if 'pickaxe' in item.name:
-                self.bot.equip(item, 'hand')
-                break
-
-        #dig a 2 by 2 by 2 hole:
-        for x in range(-int(parameters['width']),0):
-            for z in range(-int(parameters['width']),0):
-                for y in range(-int(parameters['depth']),0):
-                    print(f"digging {x}, {y}, {z}")
-                    block_to_dig = self.bot.blockAt(self.bot.entity.position.offset(x, y, z))
-                    self.bot.dig(block_to_dig)
+        result = self.dig_planner.dig_hole(parameters['width'], parameters['depth'])
 
-        return {"message": "Done"}, "REPROMPT"
+        return result, "REPROMPT"
 
+    @action("Make the bot jump.")
     def action_jump(self, parameters):
         self.logger.info("Jumping")
         self.logger.info(parameters)
@@ -55,6 +145,7 @@ class FunctionHandler:
         self.bot.setControlState('jump', False)
         return {"message": "Done"}, "REPROMPT"
 
+    @action("Check whether it is raining in the game.", read_only=True, cache_ttl=60)
     def action_is_raining(self, parameters):
         self.logger.info("Checking if it's raining.")
         self.logger.info(parameters)
@@ -62,6 +153,7 @@ class FunctionHandler:
         self.logger.info(result)
         return {"raining": result}, "REPROMPT"
     
+    @action("Get the current time.", read_only=True, cache_ttl=1)
     def action_get_time(self, parameters):
         self.logger.info("Getting the time.")
         self.logger.info(parameters)
@@ -70,50 +162,381 @@ class FunctionHandler:
         self.logger.info(result)
         return {"time": result}, "REPROMPT"
 
+    @action(
+        "Get the location of a player.",
+        Param('player_name', 'string', "Name of the player."),
+        read_only=True,
+        cache_ttl=10,
+    )
     def action_get_player_location(self, parameters):
         # requires the player_name to be set
         self.logger.info("Getting the location.")
         self.logger.info(parameters)
         # get location in a string format:
         player_name = parameters['player_name']
-        player = self.bot.players[player_name]
-        entity = player.entity
-        pos = entity.position
-        result = f"x:{pos.x}, y:{pos.y}, z:{pos.z}"
+        record = self.entities.player(player_name)
+        if record is None:
+            _, positions = self.world.player_positions([player_name])
+            x, y, z = positions[0]
+            if math.isnan(x):
+                return {"error": f"{player_name} is not close enough to see."}, "REPROMPT"
+            seen = 0
+        else:
+            x, y, z = record.position
+            seen = time.monotonic() - record.seen_at
+        self._location_anchors[player_name] = (x, y, z)
+        result = f"x:{x}, y:{y}, z:{z}"
         self.logger.info(result)
+        if seen > 5:
+            return {"location": result, "last_seen_seconds_ago": round(seen)}, "REPROMPT"
         return {"location": result}, "REPROMPT"
     
+    @action(
+        "List the players near the bot, nearest first.",
+        Param('radius', 'number', "Search radius in blocks. Defaults to 32.", required=False, default=32, minimum=1, maximum=256),
+        read_only=True,
+    )
+    def action_get_nearby_players(self, parameters):
+        self.logger.info("Getting nearby players.")
+        self.logger.info(parameters)
+        radius = parameters['radius']
+        position = tuple(self.world.bot_position())
+        players = [
+            {"name": record.name, "distance": round(distance, 1)}
+            for distance, record in self.entities.within(position, radius, entity_type='player')
+            if record.name != self.bot.username
+        ]
+        self.logger.info(players)
+        return {"players": players}, "REPROMPT"
+
+    @action(
+        "List the entities (players, mobs, animals, items) nearest to the bot.",
+        Param('count', 'integer', "How many entities to return. Defaults to 5.", required=False, default=5, minimum=1, maximum=50),
+        Param('entity_type', 'string', "Only return this type of entity, e.g. player, mob or object.", required=False),
+        read_only=True,
+    )
+    def action_get_nearest_entities(self, parameters):
+        self.logger.info("Getting the nearest entities.")
+        self.logger.info(parameters)
+        count = parameters['count']
+        entity_type = parameters['entity_type']
+        position = tuple(self.world.bot_position())
+        entities = [
+            {
+                "name": record.name,
+                "type": record.type,
+                "distance": round(distance, 1),
+                "location": f"x:{record.position[0]:.1f}, y:{record.position[1]:.1f}, z:{record.position[2]:.1f}",
+            }
+            for distance, record in self.entities.nearest(position, k=count, entity_type=entity_type)
+        ]
+        self.logger.info(entities)
+        return {"entities": entities}, "REPROMPT"
+
+    @action(
+        "Walk the bot to a location.",
+        Param('location_x', 'number', "X coordinate of the location."),
+        Param('location_y', 'number', "Y coordinate of the location."),
+        Param('location_z', 'number', "Z coordinate of the location."),
+    )
     def action_move_to_location(self, parameters):
         self.logger.info("Moving to location.")
         self.logger.info(parameters)
-        # get location from string into float:
-        x = float(parameters['location_x'])
-        y = float(parameters['location_y'])
-        z = float(parameters['location_z'])
+        x = parameters['location_x']
+        y = parameters['location_y']
+        z = parameters['location_z']
         range_goal = 1
-        self.bot.pathfinder.setGoal(self.pathfinder.goals.GoalNear(x, y, z, range_goal))
-        while self.bot.pathfinder.isMoving():
-            time.sleep(0.1)
-        return {"message": "movement complete"}, "REPROMPT"
+        result = self._travel(x, y, z, range_goal)
+        if result['status'] == MOVE_REACHED:
+            result['message'] = "movement complete"
+        else:
+            result['message'] = "movement did not reach the location"
+        return result, "REPROMPT"
+
+    @action(
+        "Save a named place, such as base or farm, to go back to later. Defaults to where the bot is.",
+        Param('name', 'string', "Name of the place."),
+        Param('location_x', 'number', "X coordinate of the place.", required=False),
+        Param('location_y', 'number', "Y coordinate of the place.", required=False),
+        Param('location_z', 'number', "Z coordinate of the place.", required=False),
+    )
+    def action_set_waypoint(self, parameters):
+        self.logger.info("Setting a waypoint.")
+        self.logger.info(parameters)
+        position = [parameters[key] for key in ('location_x', 'location_y', 'location_z')]
+        if None in position:
+            position = self.world.bot_position()
+        name = self.waypoints.set(parameters['name'], position)
+        x, y, z = self.waypoints.get(name)
+        return {"message": f"Saved {name} at x:{x}, y:{y}, z:{z}"}, "REPROMPT"
+
+    @action(
+        "Forget a named place.",
+        Param('name', 'string', "Name of the place."),
+    )
+    def action_remove_waypoint(self, parameters):
+        self.logger.info("Removing a waypoint.")
+        if not self.waypoints.remove(parameters['name']):
+            return {"error": f"No place named {parameters['name']}"}, "REPROMPT"
+        return {"message": f"Forgot {parameters['name']}"}, "REPROMPT"
+
+    @action("List the named places the bot knows.", read_only=True)
+    def action_list_waypoints(self, parameters):
+        self.logger.info("Listing waypoints.")
+        waypoints = {name: f"x:{x}, y:{y}, z:{z}" for name, (x, y, z) in self.waypoints.items()}
+        return {"waypoints": waypoints}, "REPROMPT"
+
+    @action(
+        "Walk the bot to a named place.",
+        Param('name', 'string', "Name of the place."),
+    )
+    def action_move_to_waypoint(self, parameters):
+        self.logger.info("Moving to a waypoint.")
+        self.logger.info(parameters)
+        position = self.waypoints.get(parameters['name'])
+        if position is None:
+            return {"error": f"No place named {parameters['name']}"}, "REPROMPT"
+        result = self._travel(*position)
+        if result['status'] == MOVE_REACHED:
+            result['message'] = "movement complete"
+        else:
+            result['message'] = "movement did not reach the place"
+        return result, "REPROMPT"
+
+    def _travel(self, x, y, z, range_goal=1):
+        """
+        Moves to a location. When the bot and the location are both near
+        waypoints joined by known trips, the bot walks that chain of trips,
+        whose paths are likely cached, before the last stretch.
+        """
+        start = tuple(self.world.bot_position())
+        first = self.waypoints.nearest(start, self.waypoint_radius)
+        last = self.waypoints.nearest((x, y, z), self.waypoint_radius)
+        route = self.waypoints.route(first, last) if first and last and first != last else None
+
+        previous = None
+        for name in route or []:
+            result = self.movement.move_to(*self.waypoints.get(name), range_goal=1)
+            if result['status'] != MOVE_REACHED:
+                if previous is not None and result['status'] == MOVE_NO_PATH:
+                    self.waypoints.disconnect(previous, name)
+                result['route'] = route
+                return result
+            previous = name
+
+        result = self.movement.move_to(x, y, z, range_goal)
+        if route:
+            result['route'] = route
+            result['distance_travelled'] = round(math.dist(start, self.world.bot_position()), 2)
+            # The path length is only that of the last stretch.
+            result.pop('path_length', None)
+        elif result['status'] == MOVE_REACHED and first and last and first != last:
+            # A new trip between two waypoints becomes an edge of the graph.
+            self.waypoints.connect(first, last, result.get('path_length', result['distance_travelled']))
+        return result
     
+    @action(
+        "Get the distance between two locations.",
+        Param('location_1', 'array', "The first location as a JSON list [x,y,z]."),
+        Param('location_2', 'array', "The second location as a JSON list [x,y,z]."),
+        read_only=True,
+    )
     def action_get_distance_between_to_entities(self, parameters):
         self.logger.info("Getting the distance between to entities.")
         self.logger.info(parameters)     
 
-        try:
-            # get location from json string:
-            location_1 = json.loads(parameters['location_1']) # [x,y,z]
-            location_2 = json.loads(parameters['location_2']) # [x,y,z]
-        except Exception as e:
-            self.logger.exception(e)
-            return {"error": "Invalid JSON list"}, "REPROMPT"
+        location_1 = parameters['location_1'] # [x,y,z]
+        location_2 = parameters['location_2'] # [x,y,z]
 
         # calculate the euclidean distance between the two entities:
         result = ((location_2[0] - location_1[0]) ** 2 + (location_2[1] - location_1[1]) ** 2 + (location_2[2] - location_1[2]) ** 2) ** 0.5
         
         self.logger.info(result)
         return {"distance": result}, "REPROMPT"
-    
+
+    @action(
+        "Rank many locations by distance to one or more targets, nearest first.",
+        Param('locations', 'string', "JSON list of [x,y,z] locations, or JSON object of name: [x,y,z].", parse=parse_points),
+        Param('targets', 'string', "Locations to measure from, in the same format. Defaults to the bot.", required=False, parse=parse_points),
+        Param('top_k', 'integer', "How many locations to return per target. Defaults to 10.", required=False, default=10, minimum=1, maximum=100),
+        read_only=True,
+    )
+    def action_get_distances(self, parameters):
+        self.logger.info("Getting the distances between many locations.")
+        self.logger.info(parameters)
+
+        names, points = parameters['locations']
+        if parameters['targets']:
+            target_names, targets = parameters['targets']
+        else:
+            target_names, targets = ["bot"], self.world.bot_position().reshape(1, 3)
+        top_k = min(parameters['top_k'], len(names))
+
+        # distances[i, j] is the distance from location i to target j.
+        distances = np.linalg.norm(points[:, None, :] - targets[None, :, :], axis=2)
+        order = np.argsort(distances, axis=0)
+
+        # Halve top_k until the result fits in an agent response.
+        while True:
+            nearest = {
+                target_name: [[names[i], round(float(distances[i, j]), 1)] for i in order[:top_k, j]]
+                for j, target_name in enumerate(target_names)
+            }
+            result = {"nearest": nearest, "top_k": top_k}
+            if top_k == 1 or len(json.dumps(result)) <= MAX_RESPONSE_CHARS:
+                break
+            top_k //= 2
+
+        self.logger.info(result)
+        return result, "REPROMPT"
+
+    @action(
+        "Find the nearest block of a type, such as oak_log or diamond_ore.",
+        Param('block_name', 'string', "Minecraft name of the block."),
+        Param('max_distance', 'number', "Search radius in blocks. Defaults to 32.", required=False, default=32, minimum=1, maximum=128),
+        read_only=True,
+    )
+    def action_find_block(self, parameters):
+        self.logger.info("Finding a block.")
+        self.logger.info(parameters)
+        block_name = parameters['block_name']
+        max_distance = parameters['max_distance']
+        x, y, z = self.world.bot_position()
+        found = self.world_cache.find_blocks([block_name], (x, y, z), max_distance=max_distance)
+        if not found:
+            return {"message": f"No {block_name} found within {max_distance:g} blocks."}, "REPROMPT"
+        bx, by, bz = found[0]
+        result = f"x:{bx}, y:{by}, z:{bz}"
+        self.logger.info(result)
+        return {"location": result}, "REPROMPT"
+
+    @action(
+        "Fill a box between two corners with a block, e.g. stone, or air to clear it.",
+        Param('block_name', 'string', "Minecraft name of the block.", parse=check_block),
+        Param('corner_1', 'array', "One corner of the box as a JSON list [x,y,z].", parse=parse_location),
+        Param('corner_2', 'array', "The opposite corner as a JSON list [x,y,z].", parse=parse_location),
+        Param('mode', 'string', f"How to fill: {', '.join(FILL_MODES)}. Defaults to replace.", required=False, default='replace'),
+    )
+    def action_fill_region(self, parameters):
+        self.logger.info("Filling a region.")
+        self.logger.info(parameters)
+        corners = np.floor([parameters['corner_1'], parameters['corner_2']]).astype(int)
+        low, high = corners.min(axis=0), corners.max(axis=0)
+        cuboids = [(0, 0, 0, *(int(v) for v in high - low))]
+        if cuboid_volume(cuboids[0]) > MAX_EDIT_VOLUME:
+            return {"error": f"The box is larger than {MAX_EDIT_VOLUME} blocks"}, "REPROMPT"
+        return self._fill(parameters['block_name'], tuple(int(v) for v in low), cuboids, parameters['mode'])
+
+    @action(
+        "Place a block at many locations at once, e.g. to build a shape.",
+        Param('block_name', 'string', "Minecraft name of the block.", parse=check_block),
+        Param('locations', 'string', "JSON list of [x,y,z] locations.", parse=parse_points),
+    )
+    def action_fill_blocks(self, parameters):
+        self.logger.info("Filling blocks.")
+        _, points = parameters['locations']
+        try:
+            origin, mask = mask_from_points(np.floor(points))
+        except ValueError as e:
+            return {"error": str(e)}, "REPROMPT"
+        return self._fill(parameters['block_name'], origin, merge_cuboids(mask))
+
+    def _fill(self, block_name, origin, cuboids, mode='replace'):
+        """Sends /fill commands for cuboids relative to origin over RCON."""
+        if self.rcon is None:
+            return {"error": "Bulk edits need RCON, which is not configured."}, "REPROMPT"
+        try:
+            commands = fill_commands(cuboids, origin, block_name, mode)
+        except ValueError as e:
+            return {"error": str(e)}, "REPROMPT"
+        report = self.rcon.run(commands)
+        self.logger.info(f"Filled {len(cuboids)} cuboids with {len(commands)} commands: {report}")
+        report['cuboids'] = len(cuboids)
+        if report['failed']:
+            report['message'] = f"{report['failed']} of {report['commands']} fill commands failed"
+        else:
+            report['message'] = "fill complete"
+        return report, "REPROMPT"
+
+    @action("List the stored designs that can be built.", read_only=True)
+    def action_list_schematics(self, parameters):
+        self.logger.info("Listing schematics.")
+        if not os.path.isdir(self.schematic_dir):
+            return {"schematics": []}, "REPROMPT"
+        names = sorted(
+            os.path.splitext(name)[0] for name in os.listdir(self.schematic_dir)
+            if name.endswith(SCHEMATIC_EXTENSIONS)
+        )
+        return {"schematics": names}, "REPROMPT"
+
+    @action(
+        "Build a stored design, such as a castle, with its lowest corner at a location.",
+        Param('name', 'string', "Name of the design, as listed by list_schematics."),
+        Param('location_x', 'number', "X coordinate of the design's lowest corner."),
+        Param('location_y', 'number', "Y coordinate of the design's lowest corner."),
+        Param('location_z', 'number', "Z coordinate of the design's lowest corner."),
+        Param('include_air', 'boolean', "Also clear the space inside the design. Defaults to false.", required=False, default=False),
+    )
+    def action_build_schematic(self, parameters):
+        self.logger.info("Building a schematic.")
+        self.logger.info(parameters)
+        if self.rcon is None:
+            return {"error": "Building needs RCON, which is not configured."}, "REPROMPT"
+        path = self._schematic_path(parameters['name'])
+        if path is None:
+            return {"error": f"No design named {parameters['name']}"}, "REPROMPT"
+        origin = tuple(math.floor(parameters[key]) for key in ('location_x', 'location_y', 'location_z'))
+
+        try:
+            schematic = open_schematic(path)
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            return {"error": f"Could not read {parameters['name']}: {e}"}, "REPROMPT"
+        with schematic:
+            # Slabs compiled so far, as (layers done, commands up to there).
+            compiled = deque()
+            announced = [0]
+
+            def on_progress(done, failed):
+                layers = None
+                while compiled and compiled[0][1] <= done:
+                    layers = compiled.popleft()[0]
+                if layers is None:
+                    return
+                quarter = 4 * layers // schematic.height
+                if 0 < quarter < 4 and quarter > announced[0]:
+                    announced[0] = quarter
+                    self._notify(f"Building {parameters['name']}: {25 * quarter}% done", key=f"build:{parameters['name']}")
+
+            commands = compile_commands(
+                schematic, origin, include_air=parameters['include_air'],
+                on_layer=lambda layers, count: compiled.append((layers, count)),
+            )
+            report = self.rcon.run(commands, on_progress=on_progress)
+            report['size'] = list(schematic.size)
+
+        self.logger.info(f"Built {parameters['name']}: {report}")
+        if report['cancelled']:
+            report['message'] = "build cancelled"
+        elif report['failed']:
+            report['message'] = f"{report['failed']} of {report['commands']} build commands failed"
+        else:
+            report['message'] = "build complete"
+        return report, "REPROMPT"
+
+    def _schematic_path(self, name):
+        """Returns the path of a stored design, or None. Names cannot leave the design folder."""
+        if os.path.basename(name) != name:
+            return None
+        for extension in ('', *SCHEMATIC_EXTENSIONS):
+            path = os.path.join(self.schematic_dir, name + extension)
+            if path.endswith(SCHEMATIC_EXTENSIONS) and os.path.isfile(path):
+                return path
+        return None
+
+    def _notify(self, message, key=None):
+        if self.notify is not None:
+            self.notify(message, key)
+
     # def action_collect_wood(self, parameters):
     #     self.logger.info("Collecting wood.")
     #     self.logger.info(parameters)
@@ -161,79 +584,267 @@ class FunctionHandler:
 
 
 
-    def call_function(self, function_name, parameters):
-        """Dynamically calls functions based on function_name."""
+    def cancel_actions(self):
+        """Stops any long-running action, such as a move, a dig or a build, that is in progress."""
+        self.dig_planner.cancel()
+        self.movement.cancel()
+        if self.rcon is not None:
+            self.rcon.cancel()
+
+    def _on_block_changed(self, x, y, z, shape_changed):
+        if shape_changed:
+            self.path_cache.invalidate(x, y, z)
+
+    def _on_entity_moved(self, record, previous_position):
+        anchor = self._location_anchors.get(record.name)
+        if anchor is None or record.type != 'player':
+            return
+        if math.dist(anchor, record.position) > self.location_threshold:
+            self._location_anchors.pop(record.name, None)
+            self.result_cache.invalidate('action_get_player_location', {'player_name': record.name})
 
-        param_dict = {}
-        for entry in parameters:
-            key = entry.get("name")
-            value = entry.get("value")
-            param_dict[key] = value
+    def is_read_only(self, function_name):
+        bound = self.actions.get(function_name)
+        return bound is not None and bound.read_only
+
+    def call_function(self, function_name, parameters):
+        """Calls the registered action named function_name."""
 
-        func = getattr(self, function_name, None)
-        if func is None:
-            self.logger.exception("Function not found.")
+        bound = self.actions.get(function_name)
+        if bound is None:
+            self.logger.error(f"Function not found: {function_name}")
             return {"error": "Function not found"}, "REPROMPT"
-        else:
-            try:
-                result, responseState = func(param_dict)
-                return result, responseState
-            except Exception as e:
-                self.logger.exception(e)
-                return {"error": "Something went wrong."}, "REPROMPT"
-        return {"error": "Function error"}, "FAILURE"
+
+        try:
+            param_dict = bound.decode(parameters)
+        except ParameterError as e:
+            self.logger.warning(e)
+            return {"error": str(e)}, "REPROMPT"
+
+        if bound.cache_ttl:
+            cached = self.result_cache.get(function_name, param_dict)
+            if cached is not None:
+                return cached
+
+        started_at = time.monotonic()
+        try:
+            result, responseState = bound.func(param_dict)
+            outcome = responseState
+        except Exception as e:
+            self.logger.exception(e)
+            result, responseState = {"error": "Something went wrong."}, "REPROMPT"
+            outcome = "ERROR"
+        metrics.ACTION_SECONDS.observe(time.monotonic() - started_at, action=function_name, state=outcome)
+        if bound.cache_ttl and outcome != "ERROR" and 'error' not in result:
+            self.result_cache.put(function_name, param_dict, (result, responseState), bound.cache_ttl)
+        return result, responseState
 
 class BedrockBot:
-    def __init__(self, playerBot, pathfinder):
+    def __init__(self, playerBot, pathfinder, max_connections=10, use_async_transport=True):
         self.logger = logging.getLogger(__name__)
-        self.bedrock_agent_runtime_client = boto3.client('bedrock-agent-runtime', region_name='us-west-2')
+        self.transport = BedrockTransport(region_name='us-west-2', max_connections=max_connections)
+        self.bedrock_agent_runtime_client = self.transport.client
+        # When False, Bedrock is called synchronously on the event loop thread.
+        self.use_async_transport = use_async_transport
+        # When True, completions are sent to the chat sentence by sentence
+        # as they arrive instead of once the whole stream has finished.
+        self.stream_chat = True
         self.agentAliasId = 'WP6MJQ3RNG'
         self.agentId = 'DEHCT5KPAE'
         self.playerBot = playerBot
+        # Every chat message the bot sends is split, merged and paced here.
+        self.chat_scheduler = ChatScheduler(self._send_chat)
         self.function_handler = FunctionHandler(playerBot, pathfinder)
+        self.function_handler.notify = self.notify_progress
+        self.action_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='action')
+        self._world_lock = asyncio.Lock()
         self.session_id = None
+        # Optional SessionManager giving each player their own session.
+        # Without one, every conversation uses session_id.
+        self.sessions = None
+        # Limits for a single conversation turn.
+        self.max_steps = 8
+        self.turn_timeout = 120
+        # Optional IntentRouter that answers simple commands without the agent.
+        self.intent_router = None
+
+    async def chat_with_agent(self, prompt, player_name=None, message=None):
+
+        self.logger.info("chat_with_agent prompt: %s", prompt)
+
+        if self.intent_router is not None and message is not None:
+            if await self._run_intent(message):
+                return True
+
+        session_id = self.session_id
+        if self.sessions is not None and player_name is not None:
+            session_id = self.sessions.get(player_name)
+
+        state = await self._run_turn(prompt, session_id)
+
+        return state == TURN_DONE
+
+    async def _run_intent(self, message):
+        """
+        Runs the action for a message the intent router recognises.
+
+        Returns:
+            bool: True if the message was answered, False if it should go to
+                the agent.
+        """
+        match = self.intent_router.match(message)
+        if match is None:
+            return False
+
+        started_at = time.monotonic()
+        function = match.intent.action
+        loop = asyncio.get_running_loop()
+        if self.function_handler.is_read_only(function):
+            result, _ = await loop.run_in_executor(self.action_executor, self.function_handler.call_function, function, [])
+        else:
+            result, _ = await self._run_exclusive(
+                loop.run_in_executor(self.action_executor, self.function_handler.call_function, function, [])
+            )
+
+        if 'error' in result:
+            self.logger.warning(f"Intent {match.intent.name} failed, asking the agent: {result['error']}")
+            self.intent_router.record(ROUTE_FAILED)
+            return False
+
+        self.chat(match.intent.reply(result), priority=PRIORITY_HIGH)
+        self.intent_router.record(ROUTE_HIT)
+        seconds = time.monotonic() - started_at
+        metrics.INTENT_SECONDS.observe(seconds)
+        self.logger.info(f"Answered {match.intent.name} locally (confidence {match.confidence}) in {seconds:.3f}s")
+        return True
 
-    async def chat_with_agent(self, prompt):
-
-        logging.info("chat_with_agent")
-        logging.info(f"prompt: {prompt}")
-
-        response = await self._invoke_agent(input_text=prompt)
-        
-        return response
+    async def _run_turn(self, prompt, session_id):
+        """
+        Runs one conversation turn as a loop of agent invocations.
+
+        Each step invokes the agent; when the agent hands control back, the
+        requested actions run and their results feed the next step. The turn
+        ends when the agent answers without asking for an action, when it has
+        used max_steps invocations, or when turn_timeout seconds have passed.
+        Cancelling the task running the turn stops it at the next await.
+
+        Returns:
+            str: The state the turn finished in.
+        """
+        deadline = time.monotonic() + self.turn_timeout
+        state = TURN_INVOKE
+        steps = 0
+        input_text = prompt
+        session_state = None
+        return_control_data = None
 
-    async def _invoke_agent(self, input_text=None, session_state=None):
+        try:
+            while state not in TURN_FINAL_STATES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    state = TURN_TIMED_OUT
+                elif state == TURN_INVOKE:
+                    if steps >= self.max_steps:
+                        state = TURN_EXHAUSTED
+                        continue
+                    steps += 1
+                    return_control_data = await asyncio.wait_for(
+                        self._invoke_agent(session_id, input_text=input_text, session_state=session_state), remaining
+                    )
+                    input_text = None
+                    state = TURN_RETURN_CONTROL if return_control_data else TURN_DONE
+                elif state == TURN_RETURN_CONTROL:
+                    session_state = await asyncio.wait_for(self._handle_return_control(return_control_data), remaining)
+                    state = TURN_INVOKE
+        except asyncio.TimeoutError:
+            state = TURN_TIMED_OUT
+        except asyncio.CancelledError:
+            self.logger.info(f"Turn cancelled after {steps} steps.")
+            raise
+
+        self.logger.info(f"Turn finished: {state} after {steps} steps.")
+        metrics.TURN_STEPS.observe(steps, state=state)
+        if state == TURN_EXHAUSTED:
+            self.chat("Sorry, that needed too many steps, so I stopped.", priority=PRIORITY_HIGH)
+        elif state == TURN_TIMED_OUT:
+            self.chat("Sorry, that took too long, so I stopped.", priority=PRIORITY_HIGH)
+
+        return state
+
+    async def _invoke_agent(self, session_id, input_text=None, session_state=None):
         
         params = {
             'agentId': self.agentId,
             'agentAliasId': self.agentAliasId,
-            'sessionId': self.session_id,
+            'sessionId': session_id,
         }
         if input_text:
             params['inputText'] = input_text
         if session_state:
             params['sessionState'] = session_state
 
-        response = self.bedrock_agent_runtime_client.invoke_agent(**params)
-        processed_response = await self._process_response(response)
+        started_at = time.monotonic()
+        if self.use_async_transport:
+            response = await self.transport.invoke_agent_async(**params)
+        else:
+            response = self.transport.invoke_agent(**params)
+        try:
+            return_control_data = await self._process_response(response, started_at)
+        finally:
+            # A turn that times out or is cancelled mid-stream gives its
+            # connection back.
+            self.transport.close(response)
+        metrics.AGENT_INVOKE_SECONDS.observe(time.monotonic() - started_at)
         
-        return processed_response
+        return return_control_data
+
+    def chat(self, message, priority=PRIORITY_NORMAL):
+        """Queues a chat message from the bot on the chat scheduler."""
+        self.chat_scheduler.submit(message, priority)
+
+    def notify_progress(self, message, key=None):
+        """
+        Sends a progress notice from a long action ahead of the paced chat,
+        so it is not held up behind the turn's other output.
+        """
+        self.chat_scheduler.submit(message, PRIORITY_HIGH, key=key)
+
+    def _send_chat(self, message):
+        metrics.CHAT_MESSAGES_OUT.inc()
+        self.playerBot.chat(message)
 
-    async def _process_response(self, response):
+    async def _process_response(self, response, started_at):
 
         self.logger.info("_process_response")
 
         completion = ""
         return_control_data = None
+        streamer = None
+        if self.stream_chat:
+            streamer = ChatStreamer(self.chat, started_at=started_at)
         
-        for event in response.get("completion", []):
+        first_chunk = True
+        async for event in self._iter_events(response):
             if 'chunk' in event:
                 chunk = event.get('chunk')
+                if first_chunk:
+                    first_chunk = False
+                    metrics.AGENT_FIRST_CHUNK_SECONDS.observe(time.monotonic() - started_at)
                 if 'bytes' in chunk:
-                    completion += chunk['bytes'].decode()
+                    if streamer:
+                        streamer.feed(chunk['bytes'])
+                    else:
+                        completion += chunk['bytes'].decode()
             if 'returnControl' in event:
                 return_control_data = event['returnControl']
 
+        if streamer:
+            streamer.close()
+            completion = streamer.text
+            if streamer.time_to_first_chat is not None:
+                metrics.CHAT_FIRST_MESSAGE_SECONDS.observe(streamer.time_to_first_chat)
+                self.logger.info(f"time_to_first_chat: {streamer.time_to_first_chat:.3f}s, messages: {streamer.messages_sent}")
+
         if 'returnControl' in response and not return_control_data:
             return_control_data = response['returnControl']
 
@@ -243,27 +854,72 @@ class BedrockBot:
         }
 
         if processed['streamed_data']:
-            logging.info(f"chat_message: {processed['streamed_data']}")
-            self.playerBot.chat(processed['streamed_data'])
-        
-        if processed['return_control_data']:
-            logging.info(f"return_control_data: {json.dumps(processed['return_control_data'], indent=2)}")
-            await self._handle_return_control(return_control_data)
-
-        return True
-
-    async def _handle_return_control(self, return_control_data):
-
-        self.logger.info("_handle_return_control")
-        self.logger.info(f"return_control_data: {json.dumps(return_control_data, indent=2)}")
-
-        functionInvocationInput = return_control_data['invocationInputs'][0]['functionInvocationInput']
+            self.logger.info("chat_message: %s", processed['streamed_data'])
+            if not streamer:
+                self.chat(processed['streamed_data'])
+
+        return processed['return_control_data']
+
+    async def _run_invocations(self, invocation_inputs):
+        """
+        Runs every function the agent asked for and returns their results in
+        the order they were requested.
+
+        Consecutive read-only actions run concurrently. Any other action waits
+        for the reads before it, runs on its own, and holds the world lock so
+        actions from other conversations cannot move the bot at the same time.
+        """
+        results = [None] * len(invocation_inputs)
+        batch = []
+
+        async def run_batch():
+            batch_results = await asyncio.gather(*(self._run_invocation(invocation_inputs[index]) for index in batch))
+            for index, result in zip(batch, batch_results):
+                results[index] = result
+            batch.clear()
+
+        for index, invocation_input in enumerate(invocation_inputs):
+            if self.function_handler.is_read_only(invocation_input['function']):
+                batch.append(index)
+                continue
+            await run_batch()
+            results[index] = await self._run_exclusive(self._run_invocation(invocation_input))
+        await run_batch()
+
+        return results
+
+    async def _run_exclusive(self, awaitable):
+        """
+        Awaits an action that changes the world while holding the world lock.
+
+        An action runs on a worker thread, which cancelling the awaiting task
+        does not stop. On cancellation the running action is told to stop,
+        and the lock is only released once its thread has returned, so the
+        next action cannot start while it is still moving the bot.
+        """
+        async with self._world_lock:
+            future = asyncio.ensure_future(awaitable)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                self.function_handler.cancel_actions()
+                while not future.done():
+                    try:
+                        await asyncio.wait({future})
+                    except asyncio.CancelledError:
+                        pass
+                raise
+
+    async def _run_invocation(self, functionInvocationInput):
 
         actionGroup = functionInvocationInput['actionGroup']
         function = functionInvocationInput['function']
-        parameters = functionInvocationInput['parameters']
+        parameters = functionInvocationInput.get('parameters', [])
 
-        result, responseState = self.function_handler.call_function(function, parameters)
+        loop = asyncio.get_running_loop()
+        result, responseState = await loop.run_in_executor(
+            self.action_executor, self.function_handler.call_function, function, parameters
+        )
 
         responseBody = {
             'TEXT': {
@@ -271,23 +927,43 @@ class BedrockBot:
             }
         }
 
+        return {
+            'functionResult' : {
+                'actionGroup': actionGroup,
+                'function': function,
+                'responseBody': responseBody,
+                'responseState': responseState
+            }
+        }
+
+    async def _iter_events(self, response):
+        if self.use_async_transport:
+            async for event in self.transport.iter_events_async(response):
+                yield event
+        else:
+            for event in self.transport.iter_events(response):
+                yield event
+
+    async def _handle_return_control(self, return_control_data):
+
+        self.logger.info("_handle_return_control")
+        self.logger.debug("return_control_data: %s", LazyJson(return_control_data))
+
+        invocation_inputs = []
+        for invocation_input in return_control_data['invocationInputs']:
+            if 'functionInvocationInput' in invocation_input:
+                invocation_inputs.append(invocation_input['functionInvocationInput'])
+            else:
+                self.logger.warning(f"Unsupported invocation input: {list(invocation_input)}")
+
         session_state = {
             'invocationId': return_control_data['invocationId'],
-            'returnControlInvocationResults': [
-                { 
-                    'functionResult' : {
-                        'actionGroup': actionGroup,
-                        'function': function,
-                        'responseBody': responseBody,
-                        'responseState': responseState
-                    }
-                }
-            ]
+            'returnControlInvocationResults': await self._run_invocations(invocation_inputs)
         }
 
-        self.logger.info(f"Session state: {json.dumps(session_state, indent=2)}")
+        self.logger.debug("Session state: %s", LazyJson(session_state))
 
-        return await self._invoke_agent(session_state=session_state)
+        return session_state
 
 # import asyncio
 
@@ -298,3 +974,7 @@ class BedrockBot:
 
 # if __name__ == "__main__":
 #     main()
+
+if __name__ == "__main__":
+    # Print the function schema for the agent's action group.
+    print(json.dumps(function_schema(FunctionHandler), indent=2))
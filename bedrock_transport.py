@@ -0,0 +1,97 @@
+"""
+This module provides an awaitable transport for Agents for Amazon Bedrock.
+
+boto3 is synchronous, so the transport runs invoke_agent, and every read from
+the event stream it returns, on a dedicated thread pool. The event loop stays
+free while a request is in flight, and several invocations can run at once
+from a single process over one shared, pooled client.
+
+The plain synchronous calls remain available as a fallback.
+
+A response holds its pooled connection until its event stream is read to the
+end or closed, so callers close it with close() once they are done with it,
+including when a turn times out or is cancelled part way through.
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+_STREAM_END = object()
+
+
+class BedrockTransport:
+    """
+    Shares one bedrock-agent-runtime client between all agent invocations.
+
+    Args:
+        region_name (str): AWS region of the agent.
+        max_connections (int): Size of the HTTP connection pool and of the
+            thread pool used to wait on it.
+        read_timeout (int): Seconds to wait for the next piece of a response.
+    """
+
+    def __init__(self, region_name='us-west-2', max_connections=10, read_timeout=120):
+        self.logger = logging.getLogger(__name__)
+        self.client = boto3.client(
+            'bedrock-agent-runtime',
+            region_name=region_name,
+            config=Config(
+                max_pool_connections=max_connections,
+                tcp_keepalive=True,
+                connect_timeout=5,
+                read_timeout=read_timeout,
+                retries={'max_attempts': 3, 'mode': 'adaptive'},
+            ),
+        )
+        self.executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix='bedrock')
+
+    def invoke_agent(self, **params):
+        """Calls invoke_agent synchronously on the calling thread."""
+        return self.client.invoke_agent(**params)
+
+    async def invoke_agent_async(self, **params):
+        """Calls invoke_agent on the transport's thread pool."""
+        future = self.executor.submit(functools.partial(self.client.invoke_agent, **params))
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # The call carries on in its thread, so close the response it
+            # returns, which nobody will read.
+            future.add_done_callback(self._close_abandoned)
+            raise
+
+    def _close_abandoned(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self.close(future.result())
+
+    def close(self, response):
+        """Closes the event stream of a response and gives its connection back."""
+        stream = response.get('completion')
+        if hasattr(stream, 'close'):
+            try:
+                stream.close()
+            except Exception as e:
+                self.logger.warning(f"Could not close the agent response stream: {e}")
+
+    def iter_events(self, response):
+        """Yields the events of an invoke_agent response synchronously."""
+        yield from response.get('completion', [])
+
+    async def iter_events_async(self, response):
+        """Yields the events of an invoke_agent response without blocking the loop."""
+        loop = asyncio.get_running_loop()
+        events = iter(response.get('completion', []))
+        while True:
+            event = await loop.run_in_executor(self.executor, next, events, _STREAM_END)
+            if event is _STREAM_END:
+                break
+            yield event
+
+    def shutdown(self):
+        """Stops the thread pool once the in-flight calls have finished."""
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,206 @@
+"""
+This module measures how much time the bot spends talking to Node.js over the
+javascript bridge.
+
+Every property read, call and assignment on a mineflayer proxy is a
+synchronous round trip to the Node.js process. When profiling is turned on,
+the bot and pathfinder proxies are wrapped in ProfiledProxy objects that time
+each of those round trips and charge it to the agent action running on the
+current thread. The evaluate() helper is covered too, since it goes through
+the bridge's global proxy, which is wrapped in the same way. Awaited
+JavaScript, such as bot.dig inside evaluate, is timed as part of the call that
+awaits it.
+
+Profiling is opt-in. When it is off nothing is wrapped, so the bot talks to
+the bridge exactly as it would without this module.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+
+from javascript import config
+from javascript.proxy import INTERNAL_VARS, Proxy
+
+import metrics
+
+GET = "get"
+CALL = "call"
+SET = "set"
+
+# Round trips made outside any action, e.g. from event handlers.
+NO_ACTION = "-"
+
+_current_action = contextvars.ContextVar('bridge_profiler_action', default=NO_ACTION)
+
+
+class BridgeProfiler:
+    """
+    Counts and times bridge round trips per action.
+
+    Args:
+        log_each_action (bool): Log a line with the bridge totals after every
+            action.
+    """
+
+    def __init__(self, log_each_action=True):
+        self.logger = logging.getLogger(__name__)
+        self.log_each_action = log_each_action
+        # (action, kind) -> [round trips, seconds]
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, target, name):
+        """Returns target wrapped so its round trips are recorded."""
+        return ProfiledProxy(target, self, name)
+
+    def install(self):
+        """Wraps the bridge's global proxy, which evaluate() and require() use."""
+        if not isinstance(config.global_jsi, ProfiledProxy):
+            config.global_jsi = self.wrap(config.global_jsi, 'jsi')
+        return self
+
+    def attach(self, function_handler):
+        """Charges round trips made while an action of function_handler runs to that action."""
+        for name, bound in function_handler.actions.actions.items():
+            bound.func = self._profiled_action(name, bound.func)
+
+    def record(self, kind, seconds):
+        action = _current_action.get()
+        with self._lock:
+            totals = self._totals.get((action, kind))
+            if totals is None:
+                totals = self._totals[(action, kind)] = [0, 0.0]
+            totals[0] += 1
+            totals[1] += seconds
+        metrics.BRIDGE_ROUND_TRIPS.inc(action=action, kind=kind)
+        metrics.BRIDGE_SECONDS.inc(seconds, action=action, kind=kind)
+
+    def totals(self):
+        """
+        Returns the round trips and bridge seconds recorded so far.
+
+        Returns:
+            dict: {action: {kind: (round trips, seconds)}}
+        """
+        with self._lock:
+            items = [(key, tuple(value)) for key, value in self._totals.items()]
+        report = {}
+        for (action, kind), value in items:
+            report.setdefault(action, {})[kind] = value
+        return report
+
+    def report(self):
+        """Returns the totals as a table, the action with the most bridge time first."""
+        rows = []
+        for action, kinds in self.totals().items():
+            count = sum(value[0] for value in kinds.values())
+            seconds = sum(value[1] for value in kinds.values())
+            split = ", ".join(f"{kind} {value[0]}" for kind, value in sorted(kinds.items()))
+            rows.append((seconds, f"{action:<45} {count:>9} {seconds:>10.3f}  ({split})"))
+        rows.sort(reverse=True)
+        header = f"{'action':<45} {'trips':>9} {'seconds':>10}"
+        return "\n".join([header] + [row for _, row in rows])
+
+    def _profiled_action(self, name, func):
+        def profiled(parameters):
+            token = _current_action.set(name)
+            before = self._action_totals(name)
+            started_at = time.monotonic()
+            try:
+                return func(parameters)
+            finally:
+                _current_action.reset(token)
+                if self.log_each_action:
+                    elapsed = time.monotonic() - started_at
+                    after = self._action_totals(name)
+                    self.logger.info(
+                        f"bridge: {name} made {after[0] - before[0]} round trips, "
+                        f"{after[1] - before[1]:.3f}s of {elapsed:.3f}s"
+                    )
+        return profiled
+
+    def _action_totals(self, action):
+        with self._lock:
+            values = [value for (name, _), value in self._totals.items() if name == action]
+        return sum(value[0] for value in values), sum(value[1] for value in values)
+
+
+class ProfiledProxy:
+    """
+    Stands in for a javascript Proxy and records the time of every round trip.
+
+    Proxies returned by the wrapped object are wrapped as well. The bridge
+    recognises a ProfiledProxy as the object it wraps, so it can be passed
+    back to JavaScript as an argument.
+    """
+
+    __slots__ = ('_target', '_profiler', '_name')
+
+    def __init__(self, target, profiler, name):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_profiler', profiler)
+        object.__setattr__(self, '_name', name)
+
+    def _wrap(self, value, name):
+        if isinstance(value, Proxy):
+            return ProfiledProxy(value, self._profiler, name)
+        return value
+
+    def __getattr__(self, attr):
+        # The bridge's own bookkeeping is local to Python.
+        if attr in INTERNAL_VARS or attr.startswith('__'):
+            return getattr(self._target, attr)
+        started_at = time.perf_counter()
+        try:
+            value = getattr(self._target, attr)
+        finally:
+            self._profiler.record(GET, time.perf_counter() - started_at)
+        return self._wrap(value, f"{self._name}.{attr}")
+
+    def __getitem__(self, key):
+        started_at = time.perf_counter()
+        try:
+            value = self._target[key]
+        finally:
+            self._profiler.record(GET, time.perf_counter() - started_at)
+        return self._wrap(value, f"{self._name}[{key!r}]")
+
+    def __setattr__(self, attr, value):
+        started_at = time.perf_counter()
+        try:
+            setattr(self._target, attr, value)
+        finally:
+            self._profiler.record(SET, time.perf_counter() - started_at)
+
+    def __setitem__(self, key, value):
+        started_at = time.perf_counter()
+        try:
+            self._target[key] = value
+        finally:
+            self._profiler.record(SET, time.perf_counter() - started_at)
+
+    def __call__(self, *args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            value = self._target(*args, **kwargs)
+        finally:
+            self._profiler.record(CALL, time.perf_counter() - started_at)
+        return self._wrap(value, f"{self._name}()")
+
+    def __iter__(self):
+        for index, value in enumerate(self._target):
+            yield self._wrap(value, f"{self._name}[{index}]")
+
+    def __contains__(self, key):
+        return key in self._target
+
+    def __str__(self):
+        return str(self._target)
+
+    def __repr__(self):
+        return repr(self._target)
+
+    def valueOf(self):
+        return self._target.valueOf()
@@ -0,0 +1,200 @@
+"""
+This module hands chat messages over to the AI agent without blocking the
+javascript bridge.
+
+The main components are:
+- A single long-lived asyncio event loop running in its own daemon thread
+- One bounded queue per player, so each player's messages are answered in order
+- A debounce window, so quick messages from one player become a single prompt
+- A fixed-size pool of workers that serves the players round robin
+- Cancellation of a player's running turn when they send a newer message,
+  whose messages the next turn is told about but does not answer again
+- Admission control: a cap on messages waiting across all players
+
+The chat event handler only calls ChatDispatcher.submit, which returns
+immediately. The agent turns themselves run on the dispatcher loop.
+"""
+
+import asyncio
+import logging
+import threading
+from collections import deque
+
+import metrics
+
+# What to do with a message for a player whose queue is full.
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_REJECT = "reject"
+
+
+class ChatDispatcher:
+    """
+    Queues chat messages per player and feeds them to a bounded worker pool.
+
+    Args:
+        handler: Coroutine function called as
+            handler(player_name, message, interrupted), where interrupted
+            lists the messages of the player's previous turn if it was
+            cancelled before it finished, and is empty otherwise.
+        max_concurrency (int): Number of agent turns allowed in flight at once.
+        max_queue_depth (int): Messages a single player may have waiting.
+        cancel_stale (bool): Cancel a player's running turn as soon as the
+            same player sends another message.
+        debounce (float): Seconds to wait after a player's first message for
+            more before starting a turn. Everything the player has waiting
+            when the turn starts is merged into one message.
+        overflow (str): OVERFLOW_DROP_OLDEST drops the player's oldest waiting
+            message to make room, OVERFLOW_REJECT refuses the new one.
+        max_pending (int): Messages that may be waiting across all players.
+            New messages are refused beyond it.
+        notify: Optional callable notify(player_name, text) used to tell a
+            player their message was refused. Called once until their
+            backlog drains.
+    """
+
+    def __init__(self, handler, max_concurrency=4, max_queue_depth=5, cancel_stale=True, debounce=0.5,
+                 overflow=OVERFLOW_DROP_OLDEST, max_pending=50, notify=None):
+        if overflow not in (OVERFLOW_DROP_OLDEST, OVERFLOW_REJECT):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.logger = logging.getLogger(__name__)
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.cancel_stale = cancel_stale
+        self.debounce = debounce
+        self.overflow = overflow
+        self.max_pending = max_pending
+        self.notify = notify
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="chat-dispatcher", daemon=True)
+        self._started = threading.Event()
+        self._queues = {}
+        self._scheduled = set()
+        self._running = {}
+        self._interrupted = {}
+        self._notified = set()
+        self._ready = None
+        self._workers = []
+
+    def start(self):
+        """Starts the event loop thread and the worker pool."""
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        """Cancels the workers and stops the event loop."""
+        async def _shutdown():
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self.loop.stop()
+        self.run_coroutine(_shutdown())
+        self._thread.join(timeout=5)
+
+    def submit(self, player_name, message):
+        """
+        Queues a message for processing. Safe to call from any thread.
+
+        Args:
+            player_name (str): The name of the player who sent the message.
+            message (str): The chat message received.
+        """
+        self.loop.call_soon_threadsafe(self._enqueue, player_name, message)
+
+    def pending(self):
+        """Returns the number of messages waiting, across all players."""
+        return sum(len(queue) for queue in list(self._queues.values()))
+
+    def run_coroutine(self, coro):
+        """Schedules a coroutine on the dispatcher loop and returns its future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self._ready = asyncio.Queue()
+        for index in range(self.max_concurrency):
+            self._workers.append(self.loop.create_task(self._worker(index)))
+        self.loop.call_soon(self._started.set)
+        self.loop.run_forever()
+
+    def _enqueue(self, player_name, message):
+        queue = self._queues.get(player_name)
+        metrics.CHAT_QUEUE_DEPTH.observe(len(queue) if queue is not None else 0)
+        if queue is not None and len(queue) >= self.max_queue_depth:
+            if self.overflow == OVERFLOW_REJECT:
+                self._refuse(player_name, "Please wait, I'm still working through your last messages.")
+                return
+            queue.popleft()
+            self.logger.warning(f"Queue for {player_name} is full, dropping their oldest message.")
+            metrics.CHAT_MESSAGES_DROPPED.inc()
+        elif self.pending() >= self.max_pending:
+            self._refuse(player_name, "I'm busy right now, please try again in a moment.")
+            return
+
+        # The queue is only created once a message is admitted, so refused
+        # players leave nothing behind.
+        if queue is None:
+            queue = self._queues[player_name] = deque()
+        queue.append(message)
+
+        running = self._running.get(player_name)
+        if self.cancel_stale and running is not None:
+            running.cancel()
+
+        if player_name not in self._scheduled:
+            self._scheduled.add(player_name)
+            # Wait for the rest of a burst of messages before the turn starts.
+            self.loop.call_later(self.debounce, self._ready.put_nowait, player_name)
+
+    def _refuse(self, player_name, notice):
+        self.logger.warning(f"Refused a message from {player_name}: {notice}")
+        metrics.CHAT_MESSAGES_DROPPED.inc()
+        if self.notify is not None and player_name not in self._notified:
+            self._notified.add(player_name)
+            try:
+                self.notify(player_name, f"{player_name}: {notice}")
+            except Exception as e:
+                self.logger.warning(f"Could not notify {player_name}: {e}")
+
+    async def _worker(self, index):
+        while True:
+            player_name = await self._ready.get()
+            queue = self._queues[player_name]
+            messages = list(queue)
+            queue.clear()
+            self._notified.discard(player_name)
+            if len(messages) > 1:
+                metrics.CHAT_MESSAGES_MERGED.inc(len(messages) - 1)
+            message = "\n".join(messages)
+            interrupted = self._interrupted.pop(player_name, [])
+
+            turn = self.loop.create_task(self.handler(player_name, message, interrupted))
+            self._running[player_name] = turn
+            try:
+                await asyncio.wait({turn})
+            except asyncio.CancelledError:
+                turn.cancel()
+                raise
+            finally:
+                del self._running[player_name]
+
+            if turn.cancelled():
+                # Sending the messages again could repeat actions the turn
+                # already ran, so the next turn only hears about them.
+                self._interrupted[player_name] = messages[-self.max_queue_depth:]
+                self.logger.info(f"Cancelled stale turn for {player_name}, a newer message arrived.")
+            elif turn.exception():
+                self.logger.error(f"Turn for {player_name} failed.", exc_info=turn.exception())
+
+            # Put the player at the back of the line so one busy player
+            # cannot starve the others. Messages that arrived during the turn
+            # have already waited longer than the debounce window.
+            if not queue:
+                self._scheduled.discard(player_name)
+                self._interrupted.pop(player_name, None)
+                del self._queues[player_name]
+                if not self._queues:
+                    self._notified.clear()
+            else:
+                self._ready.put_nowait(player_name)
@@ -0,0 +1,181 @@
+"""
+This module paces everything the bot says in chat.
+
+Minecraft servers cut chat messages at 256 characters and kick players who
+chat faster than the spam threshold, which on a vanilla server allows a short
+burst and then about one message a second. Several conversations can reply at
+the same time, so all outgoing chat goes through one ChatScheduler:
+
+- Long messages are split on word boundaries to fit the length limit
+- Short messages waiting in the same lane are merged into one line
+- Sends are paced by a token bucket
+- Short confirmations go in a priority lane, ahead of long prose
+- A progress notice replaces the one with the same key still waiting, so
+  only the latest is sent
+
+Messages are sent from the scheduler's own thread, so submit() never blocks.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+# Minecraft's limit on the length of a chat message.
+MAX_CHAT_LENGTH = 256
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+
+def split_message(text, max_length=MAX_CHAT_LENGTH):
+    """
+    Splits text into parts of at most max_length characters, breaking between
+    words where possible.
+    """
+    parts = []
+    current = ""
+    for word in text.split():
+        while len(word) > max_length:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(word[:max_length])
+            word = word[max_length:]
+        if not word:
+            continue
+        if not current:
+            current = word
+        elif len(current) + 1 + len(word) <= max_length:
+            current += " " + word
+        else:
+            parts.append(current)
+            current = word
+    if current:
+        parts.append(current)
+    return parts
+
+
+class ChatScheduler:
+    """
+    Queues chat messages and sends them at a pace the server accepts.
+
+    Args:
+        send: Callable that sends one chat message.
+        rate (float): Messages per second the bucket refills at.
+        burst (int): Messages that may be sent back to back after a quiet spell.
+        max_length (int): Longest message sent.
+        coalesce_length (int): Waiting messages up to this long are merged
+            into the message before them when the two fit in one line.
+        max_pending (int): Normal priority messages kept waiting. Newer ones
+            are dropped once it is reached.
+    """
+
+    def __init__(self, send, rate=1.0, burst=4, max_length=MAX_CHAT_LENGTH, coalesce_length=64, max_pending=50):
+        self.logger = logging.getLogger(__name__)
+        self.send = send
+        self.rate = rate
+        self.burst = burst
+        self.max_length = max_length
+        self.coalesce_length = coalesce_length
+        self.max_pending = max_pending
+        self._lanes = {PRIORITY_HIGH: deque(), PRIORITY_NORMAL: deque()}
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="chat-scheduler", daemon=True)
+        self._thread.start()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate):
+        # A rate of zero would never refill the bucket, and stop the thread
+        # with a division by zero.
+        if not rate > 0:
+            raise ValueError(f"Chat rate must be positive, got {rate}")
+        self._rate = rate
+
+    @property
+    def burst(self):
+        return self._burst
+
+    @burst.setter
+    def burst(self, burst):
+        if not burst >= 1:
+            raise ValueError(f"Chat burst must be at least 1, got {burst}")
+        self._burst = burst
+
+    def submit(self, text, priority=PRIORITY_NORMAL, key=None):
+        """
+        Queues a message to be sent. Safe to call from any thread.
+
+        Args:
+            key: Optional key of a progress notice. Waiting messages with the
+                same key are dropped in favour of this one.
+        """
+        parts = split_message(text, self.max_length)
+        with self._condition:
+            lane = self._lanes[priority]
+            if key is not None:
+                kept = [entry for entry in lane if entry[0] != key]
+                lane.clear()
+                lane.extend(kept)
+            for part in parts:
+                if priority != PRIORITY_HIGH and len(lane) >= self.max_pending:
+                    self.logger.warning("Chat backlog is full, dropping message.")
+                    break
+                lane.append((key, part))
+            self._condition.notify()
+
+    def pending(self):
+        """Returns the number of messages waiting to be sent."""
+        with self._condition:
+            return sum(len(lane) for lane in self._lanes.values())
+
+    def close(self, timeout=5):
+        """Sends what is already queued, then stops the scheduler thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and not any(self._lanes.values()):
+                    self._condition.wait()
+                if not any(self._lanes.values()):
+                    return
+                delay = self._take_token()
+            if delay > 0:
+                time.sleep(delay)
+                continue
+
+            with self._condition:
+                message = self._next_message()
+            try:
+                self.send(message)
+            except Exception as e:
+                self.logger.warning(f"Could not send chat message: {e}")
+
+    def _take_token(self):
+        """Takes a token if there is one, else returns the seconds until there is."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def _next_message(self):
+        """Pops the next message, merged with the short ones after it in its lane."""
+        lane = next(lane for priority, lane in sorted(self._lanes.items()) if lane)
+        _, message = lane.popleft()
+        while lane and len(lane[0][1]) <= self.coalesce_length and len(message) + 1 + len(lane[0][1]) <= self.max_length:
+            message += " " + lane.popleft()[1]
+        return message
@@ -0,0 +1,85 @@
+"""
+This module turns a streamed agent completion into chat messages while it is
+still arriving.
+
+Completion chunks are raw UTF-8 bytes, and a multibyte character may be split
+across two chunks, so they are decoded incrementally. Text is sent as soon as
+a sentence boundary arrives, or a clause boundary once enough text has built
+up. Pacing is left to the ChatScheduler the messages are sent through.
+"""
+
+import codecs
+import re
+import time
+
+# A sentence ends at . ! or ? followed by whitespace, or at a line break.
+_SENTENCE_END = re.compile(r'[.!?](?=\s)|\n')
+# Clause boundaries are only used to break up long sentences.
+_CLAUSE_END = re.compile(r'[,;:](?=\s)')
+
+
+class ChatStreamer:
+    """
+    Sends completion text to the chat one sentence (or clause) at a time.
+
+    Args:
+        send: Callable that sends one chat message.
+        clause_length (int): Buffered characters after which a clause
+            boundary is good enough to send on.
+        started_at (float): time.monotonic() of the start of the turn, used
+            for time_to_first_chat. Defaults to now.
+    """
+
+    def __init__(self, send, clause_length=80, started_at=None):
+        self.send = send
+        self.clause_length = clause_length
+        self.started_at = time.monotonic() if started_at is None else started_at
+        self.first_chat_at = None
+        self.messages_sent = 0
+        self.text = ""
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._buffer = ""
+
+    @property
+    def time_to_first_chat(self):
+        """Seconds from the start of the turn to the first chat message, or None."""
+        if self.first_chat_at is None:
+            return None
+        return self.first_chat_at - self.started_at
+
+    def feed(self, data):
+        """Adds a chunk of completion bytes and sends whatever is ready."""
+        text = self._decoder.decode(data)
+        self.text += text
+        self._buffer += text
+
+        cut = self._find_boundary()
+        if cut:
+            self._send(self._buffer[:cut])
+            self._buffer = self._buffer[cut:]
+
+    def close(self):
+        """Sends any remaining text."""
+        tail = self._decoder.decode(b'', final=True)
+        self.text += tail
+        self._buffer += tail
+        self._send(self._buffer)
+        self._buffer = ""
+
+    def _find_boundary(self):
+        end = None
+        for match in _SENTENCE_END.finditer(self._buffer):
+            end = match.end()
+        if end is None and len(self._buffer) >= self.clause_length:
+            for match in _CLAUSE_END.finditer(self._buffer):
+                end = match.end()
+        return end
+
+    def _send(self, text):
+        text = text.strip()
+        if not text:
+            return
+        if self.first_chat_at is None:
+            self.first_chat_at = time.monotonic()
+        self.messages_sent += 1
+        self.send(text)
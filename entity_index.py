@@ -0,0 +1,161 @@
+"""
+This module tracks where players and other entities are.
+
+Positions are taken from mineflayer's entitySpawn, entityMoved and
+entityGone events and stored in a uniform grid hash, so the last known
+position of a player is a dictionary lookup and "who is near me" only looks
+at the grid cells around the point in question. A player who walks out of
+render range keeps their last known position.
+
+The events are collected on the javascript side, keeping only the latest
+position of each entity, and sent over in one batch every flush_interval
+seconds. With many mobs loaded this keeps entity traffic from crowding out
+chat on the bridge.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import namedtuple
+
+from javascript import On
+
+from world_query import evaluate
+
+EntityRecord = namedtuple('EntityRecord', ['id', 'name', 'type', 'position', 'seen_at'])
+
+
+class EntityIndex:
+    """
+    Uniform grid hash of entity positions.
+
+    Args:
+        bot: The mineflayer bot.
+        cell_size (float): Edge length of a grid cell, in blocks.
+        flush_interval (float): Seconds between batches of entity updates.
+    """
+
+    def __init__(self, bot, cell_size=16, flush_interval=0.1):
+        self.logger = logging.getLogger(__name__)
+        self.bot = bot
+        self.cell_size = cell_size
+        self._entities = {}
+        self._players = {}
+        self._cells = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+        evaluate('''
+            const moved = new Map()
+            const gone = new Set()
+            const track = (entity) => {
+              const p = entity.position
+              gone.delete(entity.id)
+              moved.set(entity.id, [entity.id, entity.username || entity.name || null, entity.type, p.x, p.y, p.z])
+            }
+            bot.on('entitySpawn', track)
+            bot.on('entityMoved', track)
+            bot.on('entityGone', (entity) => {
+              moved.delete(entity.id)
+              gone.add(entity.id)
+            })
+            setInterval(() => {
+              if (!moved.size && !gone.size) return
+              bot.emit('entityIndexBatch', {moved: [...moved.values()], gone: [...gone]})
+              moved.clear()
+              gone.clear()
+            }, interval)
+        ''', bot=bot, interval=int(flush_interval * 1000))
+
+        @On(bot, 'entityIndexBatch')
+        def on_entity_batch(this, batch, *args):
+            self._on_batch(batch)
+
+    def add_listener(self, listener):
+        """Calls listener(record, previous_position) whenever an entity moves."""
+        self._listeners.append(listener)
+
+    def update(self, entity_id, name, entity_type, position):
+        """Records the position of an entity."""
+        cell = self._cell(position)
+        with self._lock:
+            previous = self._entities.get(entity_id)
+            if previous is not None:
+                previous_cell = self._cell(previous.position)
+                if previous_cell != cell:
+                    self._cells[previous_cell].discard(entity_id)
+                    if not self._cells[previous_cell]:
+                        del self._cells[previous_cell]
+            record = EntityRecord(entity_id, name, entity_type, position, time.monotonic())
+            self._entities[entity_id] = record
+            self._cells.setdefault(cell, set()).add(entity_id)
+            if entity_type == 'player' and name:
+                self._players[name] = record
+
+        for listener in self._listeners:
+            listener(record, previous.position if previous else None)
+
+    def remove(self, entity_id):
+        """Removes an entity from the grid. Players keep their last known position."""
+        with self._lock:
+            record = self._entities.pop(entity_id, None)
+            if record is None:
+                return
+            cell = self._cell(record.position)
+            self._cells[cell].discard(entity_id)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def player(self, name):
+        """Returns the last known EntityRecord of a player, or None."""
+        return self._players.get(name)
+
+    def within(self, point, radius, entity_type=None):
+        """
+        Finds the entities within radius of a point.
+
+        Returns:
+            list: (distance, EntityRecord) tuples, nearest first.
+        """
+        reach = int(math.ceil(radius / self.cell_size))
+        cx, cy, cz = self._cell(point)
+        found = []
+        with self._lock:
+            for x in range(cx - reach, cx + reach + 1):
+                for y in range(cy - reach, cy + reach + 1):
+                    for z in range(cz - reach, cz + reach + 1):
+                        for entity_id in self._cells.get((x, y, z), ()):
+                            record = self._entities[entity_id]
+                            if entity_type and record.type != entity_type:
+                                continue
+                            distance = math.dist(point, record.position)
+                            if distance <= radius:
+                                found.append((distance, record))
+        found.sort(key=lambda hit: hit[0])
+        return found
+
+    def nearest(self, point, k=1, entity_type=None, max_radius=256):
+        """
+        Finds the k entities nearest to a point, searching outwards ring by ring.
+
+        Returns:
+            list: (distance, EntityRecord) tuples, nearest first.
+        """
+        radius = self.cell_size
+        while True:
+            found = self.within(point, radius, entity_type)
+            # Entities within radius are certain to be the nearest ones.
+            if len(found) >= k or radius >= max_radius:
+                return found[:k]
+            radius = min(radius * 2, max_radius)
+
+    def _cell(self, position):
+        size = self.cell_size
+        return (math.floor(position[0] / size), math.floor(position[1] / size), math.floor(position[2] / size))
+
+    def _on_batch(self, batch):
+        for entity_id in batch['gone']:
+            self.remove(entity_id)
+        for entity_id, name, entity_type, x, y, z in batch['moved']:
+            self.update(entity_id, name, entity_type, (x, y, z))
@@ -0,0 +1,226 @@
+"""
+This module turns a set of blocks to place into as few /fill commands as it
+can.
+
+Placing blocks one at a time through the bot costs a bridge round trip and a
+server tick per block, while a single /fill command sets up to 32768 blocks.
+The blocks are held as a boolean NumPy mask and merged greedily into
+axis-aligned cuboids: each cuboid starts at the first block not yet covered
+and grows along x, then z, then y for as long as every block it would take in
+is wanted. Cuboids over the server's volume limit are cut into slabs, and
+single blocks are set with /setblock. A hollow or outline box over the limit
+cannot be cut into slabs, since each slab would get walls of its own, so it
+is built from its six faces instead.
+"""
+
+import re
+
+import numpy as np
+
+# The most blocks the server lets a single /fill command change.
+MAX_FILL_VOLUME = 32768
+
+# /fill modes that change what a cuboid does, see the Minecraft wiki.
+FILL_MODES = ('replace', 'destroy', 'keep', 'hollow', 'outline')
+
+# The most blocks one edit may span, to keep a mistaken request from
+# queueing thousands of commands.
+MAX_EDIT_VOLUME = 2_000_000
+
+AIR = 'air'
+
+# A block id with an optional namespace and block states, e.g.
+# minecraft:oak_stairs[facing=east]. Block entity data in braces and extra
+# command arguments do not match.
+_BLOCK_ID = re.compile(r'[a-z0-9_.-]+(?::[a-z0-9_./-]+)?(?:\[[a-z0-9_=,]+\])?')
+
+# Blocks that run commands or place structures, which an edit must not place.
+FORBIDDEN_BLOCKS = ('command_block', 'chain_command_block', 'repeating_command_block', 'structure_block', 'jigsaw')
+
+
+def _run_length(row):
+    """Returns how many leading entries of a boolean vector are True."""
+    if row.all():
+        return len(row)
+    return int(row.argmin())
+
+
+def merge_cuboids(mask):
+    """
+    Covers the True cells of a 3D boolean mask with non-overlapping cuboids.
+
+    Args:
+        mask (numpy.ndarray): Boolean array indexed [x, y, z].
+
+    Returns:
+        list: (x0, y0, z0, x1, y1, z1) tuples, corners inclusive, in mask
+            coordinates.
+    """
+    remaining = np.array(mask, dtype=bool)
+    cuboids = []
+    for x0, y0, z0 in np.argwhere(remaining):
+        if not remaining[x0, y0, z0]:
+            continue
+        x1 = x0 + _run_length(remaining[x0:, y0, z0]) - 1
+        z1 = z0 + _run_length(remaining[x0:x1 + 1, y0, z0:].all(axis=0)) - 1
+        y1 = y0 + _run_length(remaining[x0:x1 + 1, y0:, z0:z1 + 1].all(axis=(0, 2))) - 1
+        remaining[x0:x1 + 1, y0:y1 + 1, z0:z1 + 1] = False
+        cuboids.append((int(x0), int(y0), int(z0), int(x1), int(y1), int(z1)))
+    return cuboids
+
+
+def split_cuboid(cuboid, max_volume=MAX_FILL_VOLUME):
+    """Cuts a cuboid into slabs of at most max_volume blocks."""
+    x0, y0, z0, x1, y1, z1 = cuboid
+    size = [x1 - x0 + 1, y1 - y0 + 1, z1 - z0 + 1]
+    if size[0] * size[1] * size[2] <= max_volume:
+        return [cuboid]
+
+    # Slice across the longest axis, as thick as the volume limit allows.
+    axis = size.index(max(size))
+    cross_section = size[0] * size[1] * size[2] // size[axis]
+    thickness = max(1, max_volume // cross_section)
+    low, high = cuboid[axis], cuboid[axis + 3]
+
+    pieces = []
+    for start in range(low, high + 1, thickness):
+        piece = list(cuboid)
+        piece[axis], piece[axis + 3] = start, min(start + thickness - 1, high)
+        pieces.extend(split_cuboid(tuple(piece), max_volume))
+    return pieces
+
+
+def shell_cuboids(cuboid):
+    """
+    Splits a cuboid into its six faces and its interior.
+
+    Returns:
+        tuple: The list of face cuboids, which do not overlap, and the
+            interior cuboid, or None if the cuboid is too thin to have one.
+    """
+    x0, y0, z0, x1, y1, z1 = cuboid
+    if x1 - x0 < 2 or y1 - y0 < 2 or z1 - z0 < 2:
+        return [cuboid], None
+    faces = [
+        (x0, y0, z0, x1, y0, z1),
+        (x0, y1, z0, x1, y1, z1),
+        (x0, y0 + 1, z0, x0, y1 - 1, z1),
+        (x1, y0 + 1, z0, x1, y1 - 1, z1),
+        (x0 + 1, y0 + 1, z0, x1 - 1, y1 - 1, z0),
+        (x0 + 1, y0 + 1, z1, x1 - 1, y1 - 1, z1),
+    ]
+    return faces, (x0 + 1, y0 + 1, z0 + 1, x1 - 1, y1 - 1, z1 - 1)
+
+
+def cuboid_volume(cuboid):
+    """Returns the number of blocks in a cuboid."""
+    x0, y0, z0, x1, y1, z1 = cuboid
+    return (x1 - x0 + 1) * (y1 - y0 + 1) * (z1 - z0 + 1)
+
+
+def mask_from_points(points, max_volume=MAX_EDIT_VOLUME):
+    """
+    Builds a mask from block positions.
+
+    Args:
+        points: (N, 3) array of integer world coordinates.
+        max_volume (int): Largest bounding box accepted.
+
+    Returns:
+        tuple: The world coordinates of mask[0, 0, 0] and the mask.
+    """
+    points = np.asarray(points, dtype=int).reshape(-1, 3)
+    origin = points.min(axis=0)
+    shape = points.max(axis=0) - origin + 1
+    if int(np.prod(shape)) > max_volume:
+        raise ValueError(f"The blocks span more than {max_volume} blocks")
+    mask = np.zeros(shape, dtype=bool)
+    local = points - origin
+    mask[local[:, 0], local[:, 1], local[:, 2]] = True
+    return tuple(int(v) for v in origin), mask
+
+
+def cuboid_command(cuboid, block, mode='replace'):
+    """
+    Writes the command that sets one cuboid, in world coordinates, to a block.
+
+    A single block is set with /setblock, which the server handles more
+    cheaply than a one block /fill.
+    """
+    x0, y0, z0, x1, y1, z1 = cuboid
+    if cuboid_volume(cuboid) == 1:
+        suffix = f" {mode}" if mode in ('destroy', 'keep') else ''
+        return f"setblock {x0} {y0} {z0} {block}{suffix}"
+    suffix = '' if mode == 'replace' else f" {mode}"
+    return f"fill {x0} {y0} {z0} {x1} {y1} {z1} {block}{suffix}"
+
+
+def block_id(block):
+    """Adds the minecraft: namespace to a block name that has none."""
+    return block if ':' in block else f"minecraft:{block}"
+
+
+def check_block(block):
+    """
+    Checks a block name that came from a player before it goes into a command.
+
+    The commands run with operator rights, so only a plain block id is
+    accepted, and blocks that run commands or place structures are refused
+    with a ValueError.
+
+    Returns:
+        str: The block's namespaced id.
+    """
+    if not isinstance(block, str) or not _BLOCK_ID.fullmatch(block):
+        raise ValueError(f"{block!r} is not a block name such as stone or minecraft:oak_planks")
+    block = block_id(block)
+    if block.split('[', 1)[0].split(':', 1)[1] in FORBIDDEN_BLOCKS:
+        raise ValueError(f"{block} cannot be placed")
+    return block
+
+
+def fill_commands(cuboids, origin, block, mode='replace', max_volume=MAX_FILL_VOLUME):
+    """
+    Writes the /fill and /setblock commands for a set of cuboids.
+
+    Cuboids are filled from the bottom up so blocks such as sand land on the
+    ones below, or from the top down when clearing to air so loose blocks
+    do not fall into the cleared space. A hollow box is cleared inside
+    before its faces are set.
+
+    Args:
+        cuboids: (x0, y0, z0, x1, y1, z1) tuples relative to origin.
+        origin (tuple): World coordinates of the cuboids' (0, 0, 0).
+        block (str): Block to fill with, e.g. stone or minecraft:oak_planks.
+        mode (str): One of FILL_MODES.
+
+    Returns:
+        list: Commands without a leading slash, ready to send over RCON.
+    """
+    if mode not in FILL_MODES:
+        raise ValueError(f"Unknown fill mode: {mode}")
+    block = check_block(block)
+    ox, oy, oz = origin
+
+    # (cuboid, mode) pieces to fill with the block, and cuboids to clear.
+    pieces = []
+    cleared = []
+    for cuboid in cuboids:
+        if mode in ('hollow', 'outline') and cuboid_volume(cuboid) > max_volume:
+            faces, interior = shell_cuboids(cuboid)
+            pieces.extend((piece, 'replace') for face in faces for piece in split_cuboid(face, max_volume))
+            if mode == 'hollow' and interior is not None:
+                cleared.extend(split_cuboid(interior, max_volume))
+        else:
+            pieces.extend((piece, mode) for piece in split_cuboid(cuboid, max_volume))
+    pieces.sort(key=lambda piece: piece[0][1], reverse=block == block_id(AIR))
+    cleared.sort(key=lambda piece: piece[1], reverse=True)
+
+    def command(cuboid, fill_block, fill_mode):
+        x0, y0, z0, x1, y1, z1 = cuboid
+        return cuboid_command((x0 + ox, y0 + oy, z0 + oz, x1 + ox, y1 + oy, z1 + oz), fill_block, fill_mode)
+
+    return (
+        [command(piece, block_id(AIR), 'replace') for piece in cleared]
+        + [command(piece, block, piece_mode) for piece, piece_mode in pieces]
+    )
@@ -8,14 +8,25 @@ The main components are:
 - Creating a BedrockBot instance to handle communication with the AI agent
 - Defining event handlers for when the bot spawns and receives chat messages
 
-The bot listens for chat messages and sends them to the BedrockBot instance,
-which communicates with the AI agent and processes the agent's responses.
+The bot listens for chat messages and queues them on a ChatDispatcher, which
+runs the BedrockBot conversations on a long-lived event loop so the chat
+handler never blocks the javascript bridge.
 """
 
-import asyncio
+import atexit
 import uuid
 from javascript import require, On
 from bedrock_agent import BedrockBot
+from bridge_profiler import BridgeProfiler
+from chat_dispatcher import ChatDispatcher
+from chat_scheduler import PRIORITY_HIGH
+from intent_router import IntentRouter
+import metrics
+from rcon_channel import RconChannel
+from RCON.ecs_discovery import from_environment as ecs_discovery_from_environment
+from session_manager import SessionManager
+from structured_logging import configure_logging
+from waypoints import WaypointGraph
 import os
 
 minecraft_server_dns_name = os.environ['MINECRAFT_NLB_DNS_NAME']
@@ -23,6 +34,37 @@ minecraft_server_port = os.environ['MINECRAFT_SERVER_PORT']
 minecraft_bot_username = os.environ['MINECRAFT_BOT_USERNAME']
 agent_alias_id = os.environ['AGENT_ALIAS_ID']
 agent_id = os.environ['AGENT_ID']
+agent_max_concurrency = int(os.environ.get('AGENT_MAX_CONCURRENCY', 4))
+agent_player_queue_depth = int(os.environ.get('AGENT_PLAYER_QUEUE_DEPTH', 5))
+agent_max_sessions = int(os.environ.get('AGENT_MAX_SESSIONS', 100))
+agent_session_ttl = float(os.environ.get('AGENT_SESSION_TTL', 600))
+agent_max_steps = int(os.environ.get('AGENT_MAX_STEPS', 8))
+agent_turn_timeout = float(os.environ.get('AGENT_TURN_TIMEOUT', 120))
+agent_cancel_stale = os.environ.get('AGENT_CANCEL_STALE', 'true').lower() == 'true'
+agent_queue_overflow = os.environ.get('AGENT_QUEUE_OVERFLOW', 'drop_oldest')
+agent_max_pending = int(os.environ.get('AGENT_MAX_PENDING', 50))
+chat_debounce = float(os.environ.get('CHAT_DEBOUNCE', 0.5))
+move_timeout = float(os.environ.get('MOVE_TIMEOUT', 60))
+world_cache_max_sections = int(os.environ.get('WORLD_CACHE_MAX_SECTIONS', 2048))
+world_cache_radius = int(os.environ.get('WORLD_CACHE_RADIUS', 4))
+bedrock_max_connections = int(os.environ.get('BEDROCK_MAX_CONNECTIONS', 10))
+bedrock_use_async_transport = os.environ.get('BEDROCK_TRANSPORT', 'async') != 'sync'
+chat_streaming = os.environ.get('CHAT_STREAMING', 'true').lower() == 'true'
+chat_rate = float(os.environ.get('CHAT_RATE', 1.0))
+chat_burst = int(os.environ.get('CHAT_BURST', 4))
+metrics_port = int(os.environ.get('METRICS_PORT', 3000))
+bridge_profile = os.environ.get('BRIDGE_PROFILE', 'false').lower() == 'true'
+log_level = os.environ.get('LOG_LEVEL', 'INFO')
+intent_router_enabled = os.environ.get('INTENT_ROUTER', 'true').lower() == 'true'
+intent_confidence = float(os.environ.get('INTENT_CONFIDENCE', 0.9))
+log_format = os.environ.get('LOG_FORMAT', 'json')
+rcon_host = os.environ.get('RCON_HOST')
+rcon_port = int(os.environ.get('MINECRAFT_SERVER_PORT_RCON', 25575))
+rcon_password = os.environ.get('RCON_PASSWORD')
+rcon_command_rate = float(os.environ.get('RCON_COMMAND_RATE', 0))
+schematic_dir = os.environ.get('SCHEMATIC_DIR', 'schematics')
+waypoint_file = os.environ.get('WAYPOINT_FILE', 'waypoints.json')
+path_cache_size = int(os.environ.get('PATH_CACHE_SIZE', 256))
 
 # minecraft_server_dns_name = 'localhost'
 # minecraft_server_port = 25565
@@ -30,6 +72,8 @@ agent_id = os.environ['AGENT_ID']
 # agent_alias_id = 'DCFT5Y8L8Z'
 # agent_id = 'DEHCT5KPAE'
 
+configure_logging(level=log_level, json_lines=log_format == 'json')
+
 session_uuid_string = uuid.uuid4().hex
 
 mineflayer = require('mineflayer')
@@ -48,10 +92,86 @@ bot.loadPlugin(pathfinder.pathfinder)
 # bot.loadPlugin(collectblock.plugin)
 mcData = require('minecraft-data')(bot.version)
 
-bedrockAgent = BedrockBot(bot, pathfinder)
+# The agent gets its own handles on the bot and pathfinder so that, when
+# profiling, only the agent's use of the bridge is wrapped and measured.
+agent_bot, agent_pathfinder = bot, pathfinder
+profiler = None
+if bridge_profile:
+    profiler = BridgeProfiler().install()
+    agent_bot = profiler.wrap(bot, 'bot')
+    agent_pathfinder = profiler.wrap(pathfinder, 'pathfinder')
+
+bedrockAgent = BedrockBot(
+    agent_bot,
+    agent_pathfinder,
+    max_connections=bedrock_max_connections,
+    use_async_transport=bedrock_use_async_transport,
+)
 bedrockAgent.agentAliasId = agent_alias_id
 bedrockAgent.agentId = agent_id
 bedrockAgent.session_id = session_uuid_string
+bedrockAgent.sessions = SessionManager(max_sessions=agent_max_sessions, idle_ttl=agent_session_ttl)
+bedrockAgent.stream_chat = chat_streaming
+bedrockAgent.chat_scheduler.rate = chat_rate
+bedrockAgent.chat_scheduler.burst = chat_burst
+bedrockAgent.max_steps = agent_max_steps
+bedrockAgent.function_handler.movement.timeout = move_timeout
+bedrockAgent.function_handler.world_cache.max_sections = world_cache_max_sections
+bedrockAgent.function_handler.world_cache.radius = world_cache_radius
+bedrockAgent.function_handler.path_cache.max_entries = path_cache_size
+bedrockAgent.function_handler.waypoints = WaypointGraph(waypoint_file or None)
+bedrockAgent.turn_timeout = agent_turn_timeout
+if rcon_password and not rcon_host:
+    # Find the server's task through ECS. The first lookup runs in the
+    # background, or comes from the disk cache, so it does not delay startup.
+    ecs_discovery = ecs_discovery_from_environment()
+    if ecs_discovery is not None:
+        rcon_host = ecs_discovery.start().host
+if rcon_host and rcon_password:
+    bedrockAgent.function_handler.rcon = RconChannel(rcon_host, rcon_port, rcon_password)
+    bedrockAgent.function_handler.rcon.rate = rcon_command_rate or None
+bedrockAgent.function_handler.schematic_dir = schematic_dir
+if intent_router_enabled:
+    bedrockAgent.intent_router = IntentRouter(threshold=intent_confidence, names=[minecraft_bot_username])
+
+if profiler is not None:
+    profiler.attach(bedrockAgent.function_handler)
+    atexit.register(lambda: print(f"Bridge profile:\n{profiler.report()}"))
+
+async def handle_message(player_name, message, interrupted):
+    """
+    Runs one agent conversation turn for a queued chat message.
+
+    Args:
+        player_name (str): The name of the player who sent the message.
+        message (str): The chat message received.
+        interrupted (list): Messages of the player's previous turn, which
+            was cancelled before it finished.
+    """
+    prompt = f"{player_name} says: {message}"
+    if interrupted:
+        earlier = "\n".join(interrupted)
+        prompt = (
+            f"(Interrupted: you were still answering {player_name}'s earlier message when this one arrived. "
+            f"Do not redo its actions unless asked again. It was: {earlier})\n{prompt}"
+        )
+    await bedrockAgent.chat_with_agent(prompt, player_name=player_name, message=message)
+
+dispatcher = ChatDispatcher(
+    handle_message,
+    max_concurrency=agent_max_concurrency,
+    max_queue_depth=agent_player_queue_depth,
+    cancel_stale=agent_cancel_stale,
+    debounce=chat_debounce,
+    overflow=agent_queue_overflow,
+    max_pending=agent_max_pending,
+    notify=lambda player_name, text: bedrockAgent.chat(text, priority=PRIORITY_HIGH),
+).start()
+metrics.CHAT_QUEUE_PENDING.set_function(dispatcher.pending)
+metrics.CHAT_OUT_PENDING.set_function(bedrockAgent.chat_scheduler.pending)
+
+if metrics_port:
+    metrics.start_server(metrics_port)
 
 @On(bot, 'spawn')
 def spawn(*args):
@@ -71,11 +191,13 @@ def handle(this, player_name, message, *args):
         message (str): The chat message received.
 
     If the message is from the bot itself, it is ignored. Otherwise, the
-    message is sent to the BedrockBot instance for processing.
+    message is queued on the dispatcher, which passes it to the BedrockBot
+    instance on its own event loop.
     """
     if player_name == bot.username:
         # This is a chat from the bot itself, so do nothing...
         return
     else:
-        # Send the message to the bedrockAgent object to connect to Agents for Amazon Bedrock.
-        asyncio.run(bedrockAgent.chat_with_agent(f"{player_name} says: {message}"))
+        metrics.CHAT_MESSAGES_IN.inc()
+        # Queue the message for the bedrockAgent object to connect to Agents for Amazon Bedrock.
+        dispatcher.submit(player_name, message)
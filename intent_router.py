@@ -0,0 +1,137 @@
+"""
+This module answers simple chat commands without asking the agent.
+
+A message such as "jump" or "what time is it" would otherwise cost a full
+agent invocation and a returnControl round trip, only for the agent to call
+one action with no parameters. The router matches the message against a table
+of precompiled patterns, each with a confidence. When exactly one intent
+matches at or above the confidence threshold, the action is run directly and
+the reply is written from its result. Anything else, including messages that
+match more than one intent, goes to the agent as before.
+"""
+
+import re
+import threading
+from collections import namedtuple
+
+import metrics
+
+# An intent is an action with no parameters, the patterns that ask for it,
+# and how to turn the action's result into a chat reply.
+Intent = namedtuple('Intent', ['name', 'action', 'patterns', 'reply'])
+IntentMatch = namedtuple('IntentMatch', ['intent', 'confidence'])
+
+ROUTE_HIT = "hit"
+ROUTE_MISS = "miss"
+ROUTE_AMBIGUOUS = "ambiguous"
+ROUTE_FAILED = "failed"
+
+# Words that make a command polite without changing what it asks for.
+_POLITE = r'(?:(?:please|pls|can you|could you|would you|will you|hey|hi|ok|okay)\s+)*'
+_PLEASE = r'(?:\s+(?:please|pls|now|for me))*'
+
+_TRAILING_PUNCTUATION = re.compile(r'[\s!?.,]+$')
+_SPACES = re.compile(r'\s+')
+
+
+def _yes_no(value):
+    return "Yes" if value else "No"
+
+
+INTENTS = (
+    Intent(
+        'jump',
+        'action_jump',
+        (
+            (rf'{_POLITE}jump{_PLEASE}', 1.0),
+            (rf'{_POLITE}(?:do a|make a) jump{_PLEASE}', 0.9),
+            (r'.*\bjump\b.*', 0.5),
+        ),
+        lambda result: "Done!",
+    ),
+    Intent(
+        'time',
+        'action_get_time',
+        (
+            (rf'{_POLITE}(?:what(?:\'s| is) the time|what time is it)(?: now)?{_PLEASE}', 1.0),
+            (rf'{_POLITE}(?:tell me )?the time{_PLEASE}', 0.9),
+            (r'time', 0.8),
+            (r'.*\btime\b.*', 0.4),
+        ),
+        lambda result: f"It's {result['time']}.",
+    ),
+    Intent(
+        'rain',
+        'action_is_raining',
+        (
+            (rf'{_POLITE}is it raining(?: (?:now|right now|outside))?{_PLEASE}', 1.0),
+            (rf'{_POLITE}(?:is it|is there) (?:going to )?rain(?:ing)?{_PLEASE}', 0.8),
+            (r'.*\brain(?:ing)?\b.*', 0.4),
+        ),
+        lambda result: f"{_yes_no(result['raining'])}, it is{'' if result['raining'] else ' not'} raining.",
+    ),
+)
+
+
+class IntentRouter:
+    """
+    Matches chat messages against the intent table.
+
+    Args:
+        intents (tuple): The Intent table. Defaults to INTENTS.
+        threshold (float): Lowest confidence that is acted on.
+        names (list): Names the bot may be addressed by, e.g. "Claude, jump".
+            They are removed from the start of a message before matching.
+    """
+
+    def __init__(self, intents=INTENTS, threshold=0.9, names=()):
+        self.intents = intents
+        self.threshold = threshold
+        self._patterns = [
+            (intent, re.compile(pattern), confidence)
+            for intent in intents
+            for pattern, confidence in intent.patterns
+        ]
+        self._address = None
+        if names:
+            alternatives = '|'.join(re.escape(name.lower()) for name in names)
+            self._address = re.compile(rf'^(?:@?(?:{alternatives})\b[\s,:]*)')
+        self._counts = {ROUTE_HIT: 0, ROUTE_MISS: 0, ROUTE_AMBIGUOUS: 0, ROUTE_FAILED: 0}
+        self._lock = threading.Lock()
+
+    def normalize(self, message):
+        text = _SPACES.sub(' ', message.strip().lower())
+        if self._address is not None:
+            text = self._address.sub('', text)
+        return _TRAILING_PUNCTUATION.sub('', text)
+
+    def match(self, message):
+        """
+        Returns the IntentMatch for a message, or None if the message should
+        go to the agent.
+        """
+        text = self.normalize(message)
+        best = {}
+        for intent, pattern, confidence in self._patterns:
+            if confidence > best.get(intent.name, (None, 0))[1] and pattern.fullmatch(text):
+                best[intent.name] = (intent, confidence)
+
+        confident = [candidate for candidate in best.values() if candidate[1] >= self.threshold]
+        if len(confident) == 1:
+            return IntentMatch(*confident[0])
+        self.record(ROUTE_AMBIGUOUS if confident else ROUTE_MISS)
+        return None
+
+    def record(self, result):
+        """Counts how a message was routed."""
+        with self._lock:
+            self._counts[result] += 1
+        metrics.INTENT_ROUTES.inc(result=result)
+
+    def stats(self):
+        """Returns the routing counts and the share of messages answered locally."""
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        counts['hit_rate'] = counts[ROUTE_HIT] / total if total else 0.0
+        return counts
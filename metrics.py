@@ -0,0 +1,347 @@
+"""
+This module collects the bot's latency and throughput metrics and serves them
+in the Prometheus text exposition format.
+
+The metrics are plain in-process counters and fixed-bucket histograms, so
+recording a value is a dictionary lookup and an addition under a lock, and a
+scrape only formats the current totals. The server is a small threaded HTTP
+server that answers GET /metrics on its own daemon thread, away from the
+javascript bridge and the agent event loop.
+
+The metrics the bot records are defined at the bottom of the module, so any
+module can import and update them without passing a registry around.
+"""
+
+import bisect
+import logging
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Bucket upper bounds, in seconds, for request latencies.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+# Bucket upper bounds for small counts such as steps per turn.
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Counter(_Metric):
+    """A total that only goes up."""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, or is read from a function at scrape time."""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """Reads the (unlabelled) value from function() on every scrape."""
+        self._function = function
+
+    def _samples(self):
+        if self._function is None:
+            return super()._samples()
+        try:
+            value = self._function()
+        except Exception:
+            logging.getLogger(__name__).exception(f"Could not read gauge {self.name}")
+            return []
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """
+    Counts observations into fixed buckets.
+
+    Args:
+        buckets (tuple): Sorted bucket upper bounds. A +Inf bucket is added.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts, then the sum of the observations.
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, **labels):
+        """Returns a context manager that observes the seconds spent inside it."""
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with self._lock:
+            values = [(key, list(series)) for key, series in self._values.items()]
+
+        lines = []
+        for key, series in values:
+            total = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                total += count
+                le = (('le', _format_value(float(bound))),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {total}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+class _Timer:
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started_at = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.monotonic() - self.started_at, **self.labels)
+
+
+class Registry:
+    """The set of metrics rendered by a scrape."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """Returns every metric in the text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would otherwise flood the log.
+        pass
+
+
+def start_server(port=3000, host='0.0.0.0', registry=REGISTRY):
+    """
+    Serves the registry on http://host:port/metrics from a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server. Call shutdown() to stop it.
+    """
+    handler = type('MetricsRequestHandler', (_MetricsRequestHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    logging.getLogger(__name__).info(f"Serving metrics on port {server.server_address[1]}")
+    return server
+
+
+# The bot's metrics.
+
+AGENT_INVOKE_SECONDS = histogram(
+    'agent_invoke_seconds',
+    "Seconds from calling invoke_agent to the end of its response stream.",
+)
+AGENT_FIRST_CHUNK_SECONDS = histogram(
+    'agent_first_chunk_seconds',
+    "Seconds from calling invoke_agent to the first completion chunk.",
+)
+CHAT_FIRST_MESSAGE_SECONDS = histogram(
+    'chat_first_message_seconds',
+    "Seconds from calling invoke_agent to the first streamed chat message.",
+)
+ACTION_SECONDS = histogram(
+    'action_seconds',
+    "Seconds spent running an agent action.",
+    labelnames=('action', 'state'),
+)
+TURN_STEPS = histogram(
+    'turn_return_control_steps',
+    "Agent invocations used by a conversation turn.",
+    labelnames=('state',),
+    buckets=COUNT_BUCKETS,
+)
+CHAT_QUEUE_DEPTH = histogram(
+    'chat_queue_depth',
+    "Messages already waiting for the same player when a message is queued.",
+    buckets=COUNT_BUCKETS,
+)
+CHAT_QUEUE_PENDING = gauge(
+    'chat_queue_pending',
+    "Messages waiting for an agent turn, across all players.",
+)
+CHAT_OUT_PENDING = gauge(
+    'chat_out_pending',
+    "Chat messages waiting on the outbound chat scheduler.",
+)
+CHAT_MESSAGES_IN = counter(
+    'chat_messages_in_total',
+    "Chat messages received from players.",
+)
+CHAT_MESSAGES_DROPPED = counter(
+    'chat_messages_dropped_total',
+    "Chat messages dropped or refused because a queue was full.",
+)
+CHAT_MESSAGES_MERGED = counter(
+    'chat_messages_merged_total',
+    "Chat messages merged into another message from the same player instead of starting their own turn.",
+)
+CHAT_MESSAGES_OUT = counter(
+    'chat_messages_out_total',
+    "Chat messages sent by the bot.",
+)
+BRIDGE_ROUND_TRIPS = counter(
+    'bridge_round_trips_total',
+    "Round trips to Node.js over the javascript bridge, when bridge profiling is on.",
+    labelnames=('action', 'kind'),
+)
+BRIDGE_SECONDS = counter(
+    'bridge_seconds_total',
+    "Seconds spent in javascript bridge round trips, when bridge profiling is on.",
+    labelnames=('action', 'kind'),
+)
+ACTION_CACHE = counter(
+    'action_cache_lookups_total',
+    "Result cache lookups for read-only actions, by action and hit or miss.",
+    labelnames=('action', 'result'),
+)
+INTENT_ROUTES = counter(
+    'intent_router_messages_total',
+    "Chat messages seen by the local intent router, by how they were routed.",
+    labelnames=('result',),
+)
+INTENT_SECONDS = histogram(
+    'intent_router_seconds',
+    "Seconds to answer a chat message locally, without the agent.",
+)
+RCON_COMMANDS = counter(
+    'rcon_commands_total',
+    "Commands sent to the server over RCON, by whether the server carried them out.",
+    labelnames=('result',),
+)
+PATH_CACHE = counter(
+    'path_cache_lookups_total',
+    "Path cache lookups for moves, by hit or miss, and paths dropped because a block on them changed.",
+    labelnames=('result',),
+)
@@ -0,0 +1,213 @@
+"""
+This module moves the bot with mineflayer-pathfinder and waits for the result
+on pathfinder events instead of polling.
+
+A move finishes when the pathfinder emits goal_reached, when a path_update
+reports that no path exists, when path_stop is emitted, when the deadline
+passes, or when the move is cancelled.
+
+With a PathCache, the path of each long successful move is recorded from
+the pathfinder's path_update events. A later move between the same cells
+follows the recorded path as a chain of short goals a few blocks apart,
+each of which the pathfinder solves with a small search, and falls back to
+a full search if the path no longer works.
+"""
+
+import json
+import logging
+import math
+import threading
+import time
+
+from javascript import On
+
+from structured_logging import RateLimitedLog
+from world_query import evaluate
+
+MOVE_REACHED = "goal_reached"
+MOVE_NO_PATH = "no_path"
+MOVE_STOPPED = "stopped"
+MOVE_TIMED_OUT = "timed_out"
+MOVE_CANCELLED = "cancelled"
+
+
+class MovementController:
+    """
+    Runs one pathfinder move at a time and reports how it ended.
+
+    Args:
+        bot: The mineflayer bot, with the pathfinder plugin loaded.
+        pathfinder: The mineflayer-pathfinder module.
+        timeout (float): Default deadline for a move, in seconds.
+        path_cache (PathCache): Where the paths of long moves are kept and
+            looked up, or None to always search.
+    """
+
+    def __init__(self, bot, pathfinder, timeout=60, path_cache=None):
+        self.logger = logging.getLogger(__name__)
+        # A dig moves the bot many times, so move results are rate limited.
+        self.move_log = RateLimitedLog(self.logger)
+        self.bot = bot
+        self.pathfinder = pathfinder
+        self.timeout = timeout
+        self.path_cache = path_cache
+        # Blocks between the goals set when following a cached path.
+        self.hop_length = 12
+        self._lock = threading.Lock()
+        self._finish_lock = threading.Lock()
+        self._done = threading.Event()
+        self._done.set()
+        self._cancelled = threading.Event()
+        self._outcome = None
+        # The points of the path walked so far, while a move is recorded.
+        self._trajectory = None
+
+        @On(bot, 'goal_reached')
+        def on_goal_reached(this, *args):
+            self._finish(MOVE_REACHED)
+
+        @On(bot, 'path_update')
+        def on_path_update(this, results, *args):
+            if self._done.is_set():
+                return
+            status = results['status']
+            if status in ('noPath', 'timeout'):
+                self._finish(MOVE_NO_PATH)
+            elif self._trajectory is not None:
+                self._record_plan(results)
+
+        @On(bot, 'path_stop')
+        def on_path_stop(this, *args):
+            self._finish(MOVE_STOPPED)
+
+    def move_to(self, x, y, z, range_goal=1, timeout=None):
+        """
+        Moves to within range_goal blocks of a point and waits until done.
+
+        Returns:
+            dict: The status of the move, the straight-line distance
+                travelled, the distance left to the goal, the time taken,
+                whether a cached path was followed and, for a recorded move,
+                the length of the path walked.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        goal = (x, y, z)
+        with self._lock:
+            start = self._position()
+            started_at = time.monotonic()
+            deadline = started_at + timeout
+            self._cancelled.clear()
+            outcome = None
+            path_length = None
+
+            path = None
+            if self.path_cache is not None and math.dist(start, goal) >= self.path_cache.min_distance:
+                path = self.path_cache.get(start, goal)
+            if path is not None:
+                outcome = self._follow(path, goal, range_goal, deadline)
+                if outcome != MOVE_REACHED:
+                    self.path_cache.discard(start, goal)
+            followed = outcome == MOVE_REACHED
+            if followed:
+                path_length = _path_length(path)
+
+            if outcome not in (MOVE_REACHED, MOVE_CANCELLED, MOVE_TIMED_OUT):
+                search_start = self._position()
+                record = self.path_cache is not None and math.dist(search_start, goal) >= self.path_cache.min_distance
+                self._trajectory = [] if record else None
+                try:
+                    outcome = self._run_goal(self.pathfinder.goals.GoalNear(x, y, z, range_goal), deadline)
+                finally:
+                    trajectory, self._trajectory = self._trajectory, None
+                if outcome == MOVE_REACHED and trajectory:
+                    self.path_cache.put(search_start, goal, trajectory)
+                    path_length = _path_length(trajectory)
+
+            end = self._position()
+            result = {
+                "status": outcome,
+                "distance_travelled": round(math.dist(start, end), 2),
+                "distance_to_goal": round(math.dist(end, goal), 2),
+                "seconds": round(time.monotonic() - started_at, 2),
+                "cached_path": followed,
+            }
+            if path_length is not None:
+                result["path_length"] = path_length
+            self.move_log.info('finished', "Move finished: %s", result)
+            return result
+
+    def cancel(self):
+        """Stops the current move, if any."""
+        self._cancelled.set()
+        if not self._done.is_set():
+            self._finish(MOVE_CANCELLED)
+            self.bot.pathfinder.stop()
+
+    def _run_goal(self, goal, deadline):
+        """Sets one pathfinder goal and waits until it is reached or fails."""
+        if self._cancelled.is_set():
+            return MOVE_CANCELLED
+        self._outcome = None
+        self._done.clear()
+        self.bot.pathfinder.setGoal(goal)
+        if not self._done.wait(max(0, deadline - time.monotonic())):
+            self._finish(MOVE_TIMED_OUT)
+        if self._outcome != MOVE_REACHED:
+            self.bot.pathfinder.setGoal(None)
+        return self._outcome
+
+    def _follow(self, path, goal, range_goal, deadline):
+        """Walks a cached path as a chain of short goals, then to the goal itself."""
+        goals = self.pathfinder.goals
+        # Points close to the goal are covered by the last leg.
+        for hx, hy, hz in path[self.hop_length:-self.hop_length // 2:self.hop_length]:
+            outcome = self._run_goal(goals.GoalNear(hx, hy, hz, 1), deadline)
+            if outcome != MOVE_REACHED:
+                return outcome
+        return self._run_goal(goals.GoalNear(*goal, range_goal), deadline)
+
+    def _record_plan(self, results):
+        """Adds a path the pathfinder planned to the path being recorded."""
+        trajectory = self._trajectory
+        try:
+            points = _path_points(results['path'])
+        except Exception as e:
+            self.move_log.warning('record', "Could not record a planned path: %s", e)
+            self._trajectory = None
+            return
+        if not points or trajectory is None:
+            return
+        # A new plan starts from where the bot is now, which replaces the
+        # rest of the previous plan.
+        if trajectory:
+            first = points[0]
+            cut = min(range(len(trajectory)), key=lambda index: math.dist(trajectory[index], first))
+            del trajectory[cut:]
+        trajectory.extend(points)
+
+    def _finish(self, outcome):
+        # Only the first event to arrive decides how the move ended.
+        with self._finish_lock:
+            if not self._done.is_set():
+                self._outcome = outcome
+                self._done.set()
+
+    def _position(self):
+        position = self.bot.entity.position
+        return (position.x, position.y, position.z)
+
+
+def _path_length(points):
+    return round(sum(math.dist(a, b) for a, b in zip(points, points[1:])), 1)
+
+
+def _path_points(path):
+    """Returns the (x, y, z) points of a pathfinder path."""
+    # The bridge hands plain event arguments to Python as lists and dicts,
+    # but a path of class instances stays a javascript proxy, which is read
+    # in one round trip.
+    if hasattr(path, 'ffid'):
+        return [tuple(point) for point in json.loads(evaluate(
+            'return JSON.stringify(Array.from(path, move => [move.x, move.y, move.z]))', path=path
+        ))]
+    return [(move['x'], move['y'], move['z']) for move in path]
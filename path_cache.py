@@ -0,0 +1,105 @@
+"""
+This module remembers the paths of the bot's recent successful trips.
+
+Players send the bot to the same few places again and again, and every
+trip to a far goal costs a full pathfinder search. A PathCache keeps the
+blocks walked on each trip longer than min_distance, keyed by the coarse
+cells of its start and goal, so a later trip between the same cells can
+follow the known path in short hops instead (see MovementController).
+
+A path is dropped as soon as a block changes shape in any cell it passes
+through, e.g. a wall is built across it or the floor is dug out, since the
+path may no longer be walkable.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+import metrics
+
+
+class PathCache:
+    """
+    Recent paths, keyed by (start cell, goal cell).
+
+    Args:
+        cell_size (int): Edge of a cell in blocks. Trips starting and ending
+            in the same cells share a path.
+        max_entries (int): Paths kept, least recently used dropped first.
+        min_distance (float): Trips shorter than this many blocks are cheap
+            to search for and are not cached.
+    """
+
+    def __init__(self, cell_size=4, max_entries=256, min_distance=16):
+        self.cell_size = cell_size
+        self.max_entries = max_entries
+        self.min_distance = min_distance
+        # (start cell, goal cell) -> (list of (x, y, z) points, cells it passes)
+        self._paths = OrderedDict()
+        # cell -> keys of the paths through it
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._paths)
+
+    def cell(self, position):
+        return tuple(math.floor(value / self.cell_size) for value in position)
+
+    def get(self, start, goal):
+        """Returns the cached path between two positions' cells, or None."""
+        key = (self.cell(start), self.cell(goal))
+        with self._lock:
+            entry = self._paths.get(key)
+            if entry is not None:
+                self._paths.move_to_end(key)
+        path = None if entry is None else entry[0]
+        metrics.PATH_CACHE.inc(result="miss" if path is None else "hit")
+        return path
+
+    def put(self, start, goal, path):
+        """Caches the path of a trip, if it is long enough to be worth it."""
+        if not path or math.dist(start, goal) < self.min_distance:
+            return
+        key = (self.cell(start), self.cell(goal))
+        # The bot stands in the block above each point and on the one below.
+        cells = {self.cell((x, y + dy, z)) for x, y, z in path for dy in (-1, 0, 1)}
+        with self._lock:
+            self._remove(key)
+            self._paths[key] = (path, cells)
+            for cell in cells:
+                self._index.setdefault(cell, set()).add(key)
+            while len(self._paths) > self.max_entries:
+                self._remove(next(iter(self._paths)))
+
+    def discard(self, start, goal):
+        """Drops the path between two positions' cells, e.g. after following it failed."""
+        with self._lock:
+            self._remove((self.cell(start), self.cell(goal)))
+
+    def invalidate(self, x, y, z):
+        """Drops every path through the cell of a block that changed."""
+        with self._lock:
+            keys = self._index.get(self.cell((x, y, z)))
+            if not keys:
+                return
+            for key in list(keys):
+                self._remove(key)
+        metrics.PATH_CACHE.inc(result="invalidated")
+
+    def clear(self):
+        with self._lock:
+            self._paths.clear()
+            self._index.clear()
+
+    def _remove(self, key):
+        entry = self._paths.pop(key, None)
+        if entry is None:
+            return
+        for cell in entry[1]:
+            keys = self._index.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[cell]
@@ -0,0 +1,208 @@
+"""
+This module lets the bot's synchronous actions run server commands over RCON.
+
+The RCON client in RCON/rcon_client.py is asyncio based, while actions run on
+the agent's worker threads. RconChannel keeps the client's connection pool
+and an event loop on a thread of its own, and streams a batch of commands
+through it: a window of commands is kept in flight on the pipelined
+connections, each response is checked for the server's failure messages, and
+a progress callback is told as commands complete.
+
+RCON commands run on the server's main thread between ticks, so a large batch
+sent flat out would stall the game. A RateController sizes the window from
+the server's response times and can also cap commands per second.
+"""
+
+import asyncio
+import itertools
+import logging
+import re
+import threading
+import time
+
+import metrics
+from RCON.rcon_client import RconClient, RconError
+
+# Responses the server sends when a /fill or /setblock command did nothing.
+_FAILURES = re.compile(
+    r"^(No blocks were filled|Could not set the block|Too many blocks|That position is not loaded"
+    r"|Cannot place blocks outside of the world|Unknown|Incorrect argument|Expected)",
+    re.IGNORECASE,
+)
+_FILLED = re.compile(r"filled (\d+) blocks?", re.IGNORECASE)
+
+# Commands read from the caller's iterable at a time.
+_READ_AHEAD = 256
+
+
+class RateController:
+    """
+    Paces a stream of commands by how quickly the server answers.
+
+    The window of commands in flight grows by one for each response that
+    comes back within target_latency and halves, at most once per window,
+    when one is slower. This keeps about target_latency seconds of work
+    queued on the server. A token bucket can cap commands per second on top.
+
+    Args:
+        max_window (int): Largest window allowed.
+        rate (float): Commands per second, or None for no cap.
+        target_latency (float): Response time, in seconds, to stay under.
+    """
+
+    def __init__(self, max_window=64, rate=None, target_latency=0.25):
+        self.max_window = max_window
+        self.rate = rate
+        self.target_latency = target_latency
+        self.window = max(1, max_window // 4)
+        self._since_decrease = 0
+        self._tokens = 1.0
+        self._refilled_at = time.monotonic()
+
+    def observe(self, latency):
+        """Adjusts the window for one response time."""
+        self._since_decrease += 1
+        if latency <= self.target_latency:
+            self.window = min(self.max_window, self.window + 1)
+        elif self._since_decrease >= self.window:
+            self.window = max(1, self.window // 2)
+            self._since_decrease = 0
+
+    def take(self):
+        """Takes a send token if there is one, else returns the seconds until there is."""
+        if not self.rate:
+            return 0
+        now = time.monotonic()
+        self._tokens = min(1.0, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+
+class RconChannel:
+    """
+    A background RCON connection pool for synchronous callers.
+
+    Args:
+        host: Minecraft server address, or a callable returning it.
+        port (int): RCON port.
+        password (str): RCON password.
+        pool_size (int): Connections kept open.
+        window (int): Most commands in flight at once while streaming a batch.
+        rate (float): Most commands per second while streaming a batch, or
+            None for no cap.
+        target_latency (float): Response time the window is sized to keep.
+        timeout (float): Seconds to wait for the connection and each response.
+    """
+
+    def __init__(self, host, port, password, pool_size=2, window=64, rate=None, target_latency=0.25, timeout=10):
+        self.logger = logging.getLogger(__name__)
+        self.window = window
+        self.rate = rate
+        self.target_latency = target_latency
+        self._cancelled = threading.Event()
+        self.client = RconClient(host, port, password, pool_size=pool_size, timeout=timeout)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="rcon-channel", daemon=True)
+        self._thread.start()
+
+    def command(self, command, timeout=None):
+        """Runs one command and returns the server's response text."""
+        return asyncio.run_coroutine_threadsafe(self.client.command(command), self._loop).result(timeout)
+
+    def run(self, commands, on_progress=None):
+        """
+        Streams commands to the server and waits for all of them.
+
+        Args:
+            commands: Iterable of commands without a leading slash. It is
+                read lazily, a few hundred commands at a time, off the
+                channel's event loop, so a generator can compile a large
+                build as it goes.
+            on_progress: Optional callable on_progress(done, failed) called
+                on the channel's thread after each command completes.
+
+        Returns:
+            dict: Counts of commands sent and failed, blocks changed as
+                reported by the server, seconds taken, whether the batch was
+                cancelled, and the first few failure messages.
+        """
+        self._cancelled.clear()
+        controller = RateController(self.window, self.rate, self.target_latency)
+        future = asyncio.run_coroutine_threadsafe(self._stream(iter(commands), on_progress, controller), self._loop)
+        return future.result()
+
+    def cancel(self):
+        """Stops sending the batch in progress. Commands already sent still complete."""
+        self._cancelled.set()
+
+    def close(self, timeout=5):
+        asyncio.run_coroutine_threadsafe(self.client.close(), self._loop).result(timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+
+    async def _stream(self, commands, on_progress, controller):
+        report = {'commands': 0, 'failed': 0, 'blocks': 0, 'seconds': 0, 'cancelled': False, 'errors': []}
+        started = time.monotonic()
+        in_flight = set()
+        buffered = []
+        exhausted = False
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._cancelled.is_set() and not exhausted:
+                exhausted = report['cancelled'] = True
+            delay = 0
+            while not exhausted and len(in_flight) < controller.window:
+                delay = controller.take()
+                if delay:
+                    break
+                if not buffered:
+                    buffered = await loop.run_in_executor(None, lambda: list(itertools.islice(commands, _READ_AHEAD)))
+                    buffered.reverse()
+                if not buffered:
+                    exhausted = True
+                    break
+                in_flight.add(asyncio.ensure_future(self._run_one(buffered.pop())))
+            if not in_flight:
+                if exhausted:
+                    break
+                await asyncio.sleep(delay)
+                continue
+            done, in_flight = await asyncio.wait(in_flight, timeout=delay or None, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                command, response, failed, latency = task.result()
+                controller.observe(latency)
+                self._tally(report, command, response, failed)
+            if done and on_progress is not None:
+                try:
+                    on_progress(report['commands'], report['failed'])
+                except Exception as e:
+                    self.logger.warning(f"Progress callback failed: {e}")
+        report['seconds'] = round(time.monotonic() - started, 3)
+        return report
+
+    async def _run_one(self, command):
+        """Returns (command, response, failed, seconds) for one command."""
+        started = time.monotonic()
+        try:
+            response = await self.client.command(command)
+        except RconError as e:
+            return command, str(e), True, time.monotonic() - started
+        return command, response, bool(_FAILURES.match(response.strip())), time.monotonic() - started
+
+    def _tally(self, report, command, response, failed):
+        report['commands'] += 1
+        metrics.RCON_COMMANDS.inc(result="failed" if failed else "ok")
+        if failed:
+            report['failed'] += 1
+            self.logger.debug(f"RCON command {command!r} failed: {response}")
+            if len(report['errors']) < 5:
+                report['errors'].append(response)
+            return
+        filled = _FILLED.search(response)
+        if filled:
+            report['blocks'] += int(filled.group(1))
+        elif response.startswith("Changed the block"):
+            report['blocks'] += 1
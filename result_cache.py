@@ -0,0 +1,91 @@
+"""
+This module keeps the recent results of read-only actions in memory.
+
+An action declared with a cache_ttl has its result kept for that many seconds,
+keyed by the action and its decoded parameters, so asking the same question
+twice in one conversation does not cross the javascript bridge again. Game
+events can drop entries before they expire, e.g. the weather result when it
+starts raining.
+"""
+
+import threading
+import time
+
+import metrics
+
+
+def _key(parameters):
+    """Returns a hashable key for decoded parameters, or None if they have none."""
+    try:
+        key = tuple(sorted(parameters.items()))
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class ResultCache:
+    """
+    Action results with a time to live.
+
+    Args:
+        max_entries (int): Entries kept before expired ones are purged and,
+            if that is not enough, the oldest are dropped.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # (action, key) -> (expires_at, value)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, action, parameters):
+        """Returns the cached value for an action call, or None."""
+        key = _key(parameters)
+        if key is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((action, key))
+            if entry is not None and entry[0] <= now:
+                del self._entries[(action, key)]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.ACTION_CACHE.inc(action=action, result="miss" if entry is None else "hit")
+        return None if entry is None else entry[1]
+
+    def put(self, action, parameters, value, ttl):
+        key = _key(parameters)
+        if key is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._purge(now)
+            self._entries[(action, key)] = (now + ttl, value)
+
+    def invalidate(self, action, parameters=None):
+        """Drops the cached result of one call, or of every call when parameters is None."""
+        with self._lock:
+            if parameters is not None:
+                self._entries.pop((action, _key(parameters)), None)
+                return
+            for entry in [entry for entry in self._entries if entry[0] == action]:
+                del self._entries[entry]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _purge(self, now):
+        for entry in [entry for entry, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[entry]
+        # Dicts keep insertion order, so the first entries are the oldest.
+        excess = len(self._entries) - self.max_entries + 1
+        for entry in list(self._entries)[:max(0, excess)]:
+            del self._entries[entry]
@@ -0,0 +1,367 @@
+"""
+This module reads stored building designs and compiles them to server
+commands.
+
+Two file formats are understood:
+
+- Sponge schematics (.schem, versions 1 to 3), as saved by WorldEdit
+- Structure files (.nbt), as saved by structure blocks
+
+Both are gzipped NBT. A file is decompressed once into a temporary file and
+memory-mapped, and the NBT reader leaves large arrays in the mapping, so only
+the parts being worked on are in memory. A Sponge schematic stores its blocks
+as a varint per block, indexes into a palette of block states; these are
+decoded a slab of layers at a time.
+
+compile_commands() turns each slab into /fill and /setblock commands, one
+greedy cuboid merge per block state (see fill_planner), and yields them
+bottom-up so a build can be streamed to the server as it is compiled. Block
+entity data, such as chest contents and sign text, and entities are not
+copied.
+"""
+
+import abc
+import gzip
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+
+from fill_planner import block_id, cuboid_command, merge_cuboids, split_cuboid
+
+SCHEMATIC_EXTENSIONS = ('.schem', '.nbt')
+
+# Blocks that are left out of a build unless air is asked for.
+AIR_BLOCKS = ('minecraft:air', 'minecraft:cave_air', 'minecraft:void_air')
+# Marks a position a structure leaves as it is. Never placed.
+STRUCTURE_VOID = 'minecraft:structure_void'
+
+# Bytes of block data decoded at a time.
+_CHUNK = 1 << 20
+
+(TAG_END, TAG_BYTE, TAG_SHORT, TAG_INT, TAG_LONG, TAG_FLOAT, TAG_DOUBLE, TAG_BYTE_ARRAY,
+ TAG_STRING, TAG_LIST, TAG_COMPOUND, TAG_INT_ARRAY, TAG_LONG_ARRAY) = range(13)
+
+_SCALARS = {
+    TAG_BYTE: struct.Struct('>b'),
+    TAG_SHORT: struct.Struct('>h'),
+    TAG_INT: struct.Struct('>i'),
+    TAG_LONG: struct.Struct('>q'),
+    TAG_FLOAT: struct.Struct('>f'),
+    TAG_DOUBLE: struct.Struct('>d'),
+}
+_ARRAYS = {TAG_BYTE_ARRAY: np.dtype('>i1'), TAG_INT_ARRAY: np.dtype('>i4'), TAG_LONG_ARRAY: np.dtype('>i8')}
+_LENGTH = struct.Struct('>i')
+_STRING_LENGTH = struct.Struct('>H')
+
+
+class NbtArray:
+    """
+    An NBT array left in the file until it is read.
+
+    Args:
+        buffer: The mapped file.
+        offset (int): Position of the first element.
+        length (int): Number of elements.
+        dtype (numpy.dtype): Element type.
+    """
+
+    def __init__(self, buffer, offset, length, dtype):
+        self.buffer = buffer
+        self.offset = offset
+        self.length = length
+        self.dtype = dtype
+
+    def __len__(self):
+        return self.length
+
+    def read_bytes(self, start=0, stop=None):
+        """Returns the raw bytes of elements start to stop."""
+        stop = self.length if stop is None else min(stop, self.length)
+        size = self.dtype.itemsize
+        return self.buffer[self.offset + start * size:self.offset + stop * size]
+
+    def read(self, start=0, stop=None):
+        """Returns elements start to stop as a NumPy array."""
+        return np.frombuffer(self.read_bytes(start, stop), dtype=self.dtype)
+
+
+def _read_string(buffer, pos):
+    (length,) = _STRING_LENGTH.unpack_from(buffer, pos)
+    pos += 2
+    return buffer[pos:pos + length].decode('utf-8', errors='replace'), pos + length
+
+
+def _read_payload(buffer, pos, tag):
+    """Reads one tag's payload. Returns (value, position after it)."""
+    scalar = _SCALARS.get(tag)
+    if scalar is not None:
+        return scalar.unpack_from(buffer, pos)[0], pos + scalar.size
+    if tag in _ARRAYS:
+        (length,) = _LENGTH.unpack_from(buffer, pos)
+        pos += 4
+        dtype = _ARRAYS[tag]
+        return NbtArray(buffer, pos, length, dtype), pos + length * dtype.itemsize
+    if tag == TAG_STRING:
+        return _read_string(buffer, pos)
+    if tag == TAG_LIST:
+        item_tag = buffer[pos]
+        (length,) = _LENGTH.unpack_from(buffer, pos + 1)
+        pos += 5
+        items = []
+        for _ in range(length):
+            item, pos = _read_payload(buffer, pos, item_tag)
+            items.append(item)
+        return items, pos
+    if tag == TAG_COMPOUND:
+        compound = {}
+        while True:
+            child_tag = buffer[pos]
+            pos += 1
+            if child_tag == TAG_END:
+                return compound, pos
+            name, pos = _read_string(buffer, pos)
+            compound[name], pos = _read_payload(buffer, pos, child_tag)
+    raise ValueError(f"Unknown NBT tag {tag} at byte {pos}")
+
+
+def read_nbt(buffer):
+    """Reads the root compound of an uncompressed NBT file. Returns (name, compound)."""
+    if buffer[0] != TAG_COMPOUND:
+        raise ValueError("Not an NBT file")
+    name, pos = _read_string(buffer, 1)
+    compound, _ = _read_payload(buffer, pos, TAG_COMPOUND)
+    return name, compound
+
+
+def decode_varints(data):
+    """
+    Decodes the complete varints at the start of data.
+
+    Returns:
+        tuple: An int64 array of the values and the number of bytes used.
+            A varint cut off at the end of data is left for the next call.
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(raw < 0x80)
+    if not len(ends):
+        return np.empty(0, dtype=np.int64), 0
+    used = int(ends[-1]) + 1
+    raw = raw[:used]
+    if len(ends) == used:
+        # Every value fits in one byte, as with palettes under 128 states.
+        return raw.astype(np.int64), used
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    first_byte = np.repeat(starts, ends - starts + 1)
+    shifts = 7 * (np.arange(used) - first_byte)
+    return np.add.reduceat((raw & 0x7f).astype(np.int64) << shifts, starts), used
+
+
+def _state_string(entry):
+    """Returns the block state of a structure palette entry, e.g. minecraft:oak_stairs[facing=east]."""
+    name = block_id(entry['Name'])
+    properties = entry.get('Properties')
+    if not properties:
+        return name
+    return f"{name}[{','.join(f'{key}={value}' for key, value in sorted(properties.items()))}]"
+
+
+class Schematic(abc.ABC):
+    """
+    An open design file.
+
+    Use open_schematic() to open one. The file stays mapped until close().
+
+    Attributes:
+        width, height, length (int): Size along x, y and z.
+        palette (list): Block state of each palette index. None for indexes
+            the file does not use.
+    """
+
+    def __init__(self, buffer, file, width, height, length, palette):
+        self._buffer = buffer
+        self._file = file
+        self.width = width
+        self.height = height
+        self.length = length
+        self.palette = palette
+
+    @property
+    def size(self):
+        return self.width, self.height, self.length
+
+    @abc.abstractmethod
+    def layers(self, slab=16):
+        """
+        Yields the blocks a slab of layers at a time, bottom-up.
+
+        Yields:
+            tuple: The y of the slab's lowest layer, and an int64 array of
+                palette indexes indexed [x, y, z]. -1 marks a position to
+                leave as it is.
+        """
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SpongeSchematic(Schematic):
+    """A Sponge schematic, with its block data decoded lazily."""
+
+    def __init__(self, buffer, file, width, height, length, palette, block_data):
+        super().__init__(buffer, file, width, height, length, palette)
+        self.block_data = block_data
+
+    def layers(self, slab=16):
+        per_layer = self.width * self.length
+        values = np.empty(0, dtype=np.int64)
+        pos = 0
+        y = 0
+        while y < self.height:
+            needed = per_layer * min(slab, self.height - y)
+            while len(values) < needed:
+                chunk = self.block_data.read_bytes(pos, pos + _CHUNK)
+                decoded, used = decode_varints(chunk)
+                if not used:
+                    raise ValueError("The block data ends before the last layer")
+                pos += used
+                values = np.concatenate((values, decoded))
+            # Sponge orders blocks by y, then z, then x.
+            layers = values[:needed].reshape(-1, self.length, self.width)
+            values = values[needed:]
+            yield y, layers.transpose(2, 0, 1)
+            y += layers.shape[0]
+
+
+class StructureSchematic(Schematic):
+    """A structure block file. These are small enough to expand in one go."""
+
+    def __init__(self, buffer, file, width, height, length, palette, blocks):
+        super().__init__(buffer, file, width, height, length, palette)
+        self.blocks = blocks
+
+    def layers(self, slab=16):
+        states = np.full(self.size, -1, dtype=np.int64)
+        for block in self.blocks:
+            x, y, z = block['pos']
+            states[x, y, z] = block['state']
+        for y in range(0, self.height, slab):
+            yield y, states[:, y:y + slab, :]
+
+
+def _map_file(path):
+    """Returns (buffer, file) for the uncompressed contents of a possibly gzipped file."""
+    with open(path, 'rb') as source:
+        gzipped = source.read(2) == b'\x1f\x8b'
+    if gzipped:
+        file = tempfile.TemporaryFile()
+        with gzip.open(path, 'rb') as source:
+            shutil.copyfileobj(source, file, _CHUNK)
+        file.flush()
+    else:
+        file = open(path, 'rb')
+    try:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        file.close()
+        raise ValueError(f"{os.path.basename(path)} is empty")
+    return buffer, file
+
+
+def open_schematic(path):
+    """
+    Opens a .schem or structure .nbt file.
+
+    Returns:
+        Schematic: The open design. Close it, or use it in a with block,
+            when done.
+    """
+    buffer, file = _map_file(path)
+    try:
+        _, root = read_nbt(buffer)
+        # Version 3 nests everything in a Schematic compound.
+        root = root.get('Schematic', root)
+        if 'Width' in root:
+            return _open_sponge(buffer, file, root)
+        if 'size' in root and 'blocks' in root:
+            return _open_structure(buffer, file, root)
+        raise ValueError(f"{os.path.basename(path)} is not a Sponge schematic or structure file")
+    except BaseException:
+        buffer.close()
+        file.close()
+        raise
+
+
+def _open_sponge(buffer, file, root):
+    blocks = root.get('Blocks', root)
+    palette_tag = blocks.get('Palette')
+    block_data = blocks.get('Data', blocks.get('BlockData'))
+    if palette_tag is None or block_data is None:
+        raise ValueError("The schematic has no blocks")
+    palette = [None] * (max(palette_tag.values(), default=-1) + 1)
+    for state, index in palette_tag.items():
+        palette[index] = state
+    # Sizes are stored as signed shorts but are unsigned.
+    width, height, length = (root[key] & 0xffff for key in ('Width', 'Height', 'Length'))
+    return SpongeSchematic(buffer, file, width, height, length, palette, block_data)
+
+
+def _open_structure(buffer, file, root):
+    # Structures with random variants have several palettes; the first is used.
+    palette_tags = root.get('palette') or (root.get('palettes') or [[]])[0]
+    palette = [_state_string(entry) for entry in palette_tags]
+    width, height, length = root['size']
+    return StructureSchematic(buffer, file, width, height, length, palette, root['blocks'])
+
+
+def compile_commands(schematic, origin, include_air=False, slab=16, on_layer=None):
+    """
+    Compiles a design into /fill and /setblock commands.
+
+    Args:
+        schematic (Schematic): The open design.
+        origin (tuple): World coordinates for the design's lowest x, y, z corner.
+        include_air (bool): Whether to place the design's air, clearing what
+            is already there.
+        slab (int): Layers merged at a time. Taller slabs give fewer
+            commands but take more memory.
+        on_layer: Optional callable on_layer(layers_done, commands_so_far)
+            called after each slab's commands are yielded.
+
+    Yields:
+        str: Commands without a leading slash, bottom-up.
+    """
+    skipped = {STRUCTURE_VOID} if include_air else {STRUCTURE_VOID, *AIR_BLOCKS}
+    palette = [
+        None if state is None or state.split('[', 1)[0] in skipped else state
+        for state in schematic.palette
+    ]
+    ox, oy, oz = origin
+    count = 0
+    for y, layers in schematic.layers(slab):
+        pieces = []
+        for index in np.unique(layers):
+            if index < 0 or index >= len(palette) or palette[index] is None:
+                continue
+            for cuboid in merge_cuboids(layers == index):
+                pieces.extend((piece, palette[index]) for piece in split_cuboid(cuboid))
+        pieces.sort(key=lambda piece: piece[0][1])
+        for (x0, y0, z0, x1, y1, z1), state in pieces:
+            count += 1
+            yield cuboid_command((x0 + ox, y0 + y + oy, z0 + oz, x1 + ox, y1 + y + oy, z1 + oz), state)
+        if on_layer is not None:
+            on_layer(y + layers.shape[1], count)
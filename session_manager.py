@@ -0,0 +1,72 @@
+"""
+This module keeps one Agents for Amazon Bedrock session per player.
+
+Sessions are created lazily the first time a player talks to the bot and are
+keyed by player name, so a player who reconnects picks up the same session.
+The number of live sessions is bounded: the least recently used session is
+evicted when the bound is reached, and sessions idle for longer than the TTL
+are dropped so their context starts fresh.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class SessionManager:
+    """
+    Maps player names to Bedrock session ids.
+
+    Args:
+        max_sessions (int): Maximum number of live sessions.
+        idle_ttl (float): Seconds after which an unused session expires.
+    """
+
+    def __init__(self, max_sessions=100, idle_ttl=600):
+        self.logger = logging.getLogger(__name__)
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, player_name):
+        """
+        Returns the session id for a player, creating one if needed.
+
+        Args:
+            player_name (str): The name of the player.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(player_name)
+            if entry is None:
+                entry = self._sessions[player_name] = [uuid.uuid4().hex, now]
+                self.logger.info(f"New session for {player_name}: {entry[0]}")
+                while len(self._sessions) > self.max_sessions:
+                    evicted, _ = self._sessions.popitem(last=False)
+                    self.logger.info(f"Evicted session for {evicted}")
+            else:
+                entry[1] = now
+                self._sessions.move_to_end(player_name)
+            return entry[0]
+
+    def end(self, player_name):
+        """Forgets a player's session so their next message starts a new one."""
+        with self._lock:
+            self._sessions.pop(player_name, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expire(self, now):
+        # The dict is kept in least recently used order, so expired entries
+        # are always at the front.
+        while self._sessions:
+            player_name, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            del self._sessions[player_name]
+            self.logger.info(f"Expired session for {player_name}")
@@ -0,0 +1,197 @@
+"""
+This module sets up logging for the bot so that writing a log line never
+blocks the caller.
+
+The main components are:
+- A queue handler on the root logger. Callers only render the message and
+  put the record on a queue; JSON formatting and writing to stdout happen on
+  a background listener thread
+- A JSON-lines formatter, one object per record, so CloudWatch can filter on
+  fields instead of parsing text
+- LazyJson, which defers serializing a payload until a handler formats it.
+  With %-style arguments nothing is serialized at all when the level is off
+- RateLimitedLog, for messages that would otherwise be logged once per block
+  or per event
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import threading
+import time
+
+# Attributes every LogRecord has. Anything else was passed with extra=.
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Marks where a LazyJson argument goes in an otherwise rendered message.
+_LAZY_MARK = re.compile(r'\x00lazy(\d+)\x00')
+
+
+class LazyJson:
+    """
+    Serializes a value to JSON only when it is turned into a string.
+
+    Pass it as a %-style argument, e.g. logger.debug("state: %s", LazyJson(state)).
+    The value is serialized later on the logging thread, so it must not be
+    changed after it has been logged.
+    """
+
+    __slots__ = ('value', 'indent')
+
+    def __init__(self, value, indent=None):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self):
+        return json.dumps(self.value, indent=self.indent, default=str)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats each record as a single line of JSON."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _LazyMark:
+    """Stands in for a LazyJson argument while the rest of a message is rendered."""
+
+    __slots__ = ('text',)
+
+    def __init__(self, index):
+        self.text = f"\x00lazy{index}\x00"
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return self.text
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records with their message already rendered, so arguments changed
+    after the call cannot change the line or break the listener thread. Only
+    LazyJson arguments are left for the listener to serialize.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        lazy = []
+
+        def mark(value):
+            if isinstance(value, LazyJson):
+                lazy.append(value)
+                return _LazyMark(len(lazy) - 1)
+            return value
+
+        message = str(record.msg)
+        if record.args:
+            if isinstance(record.args, dict):
+                args = {key: mark(value) for key, value in record.args.items()}
+            else:
+                args = tuple(mark(value) for value in record.args)
+            message = message % args
+
+        if lazy:
+            record.args = tuple(lazy[int(index)] for index in _LAZY_MARK.findall(message))
+            record.msg = _LAZY_MARK.sub('%s', message.replace('%', '%%'))
+        else:
+            record.msg, record.args = message, None
+        return record
+
+
+class RateLimitedLog:
+    """
+    Logs a message at most once per interval for each key, and says how many
+    were held back in between.
+
+    Args:
+        logger: The logger to write to.
+        interval (float): Minimum seconds between two messages with the same key.
+    """
+
+    def __init__(self, logger, interval=5.0):
+        self.logger = logger
+        self.interval = interval
+        self._last = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def log(self, level, key, message, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and now - last < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return
+            self._last[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            message += f" ({suppressed} similar messages suppressed)"
+        self.logger.log(level, message, *args)
+
+    def info(self, key, message, *args):
+        self.log(logging.INFO, key, message, *args)
+
+    def warning(self, key, message, *args):
+        self.log(logging.WARNING, key, message, *args)
+
+
+def configure_logging(level=logging.INFO, json_lines=True, stream=None):
+    """
+    Sends all logging through a queue to a background thread that writes to
+    stream (stdout by default).
+
+    Args:
+        level: Root log level, as a number or a name such as 'DEBUG'.
+        json_lines (bool): Write JSON lines. When False, write plain text.
+
+    Returns:
+        QueueListener: The running listener. It is stopped, flushing any
+            queued records, when the interpreter exits.
+    """
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if json_lines:
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(name)s %(levelname)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S'
+        ))
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_DeferredQueueHandler(records))
+    root.setLevel(level if isinstance(level, int) else str(level).upper())
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,42 @@
+import pytest
+
+from action_registry import BoundAction, Param, ParameterError, action
+
+
+class Handler:
+    @action(
+        "Find the nearest block of a type.",
+        Param('block_name', 'string', "Minecraft name of the block."),
+        Param('max_distance', 'number', "Search radius in blocks.", required=False, default=32, minimum=1, maximum=128),
+        read_only=True,
+    )
+    def action_find_block(self, parameters):
+        return parameters, "REPROMPT"
+
+
+@pytest.fixture
+def find_block():
+    return BoundAction(Handler.action_find_block.action_spec, Handler().action_find_block)
+
+
+@pytest.mark.parametrize('value', ['0', '-5', '0.5', '129', '1e9', '1e999', 'nan'])
+def test_out_of_range_distance_is_a_parameter_error(find_block, value):
+    with pytest.raises(ParameterError):
+        find_block.decode([{'name': 'block_name', 'value': 'oak_log'}, {'name': 'max_distance', 'value': value}])
+
+
+@pytest.mark.parametrize('value, expected', [('1', 1.0), ('64.5', 64.5), ('128', 128.0), (None, 32)])
+def test_in_range_distance_is_decoded(find_block, value, expected):
+    decoded = find_block.decode([{'name': 'block_name', 'value': 'oak_log'}, {'name': 'max_distance', 'value': value}])
+    assert decoded['max_distance'] == expected
+
+
+def test_bounds_are_described_to_the_agent():
+    assert Param('radius', 'number', "Search radius.", minimum=1, maximum=256).schema()['description'] == \
+        "Search radius. From 1 to 256."
+    assert Param('top_k', 'integer', "How many.", minimum=1).schema()['description'] == "How many. At least 1."
+
+
+def test_default_must_be_in_bounds():
+    with pytest.raises(ValueError):
+        Param('radius', 'number', required=False, default=0, minimum=1, maximum=256)
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+
+import pytest
+
+from chat_dispatcher import ChatDispatcher
+
+
+class RecordingHandler:
+    """Runs each message's "action" once, then keeps the turn open until released."""
+
+    def __init__(self):
+        self.calls = []
+        self.actions = []
+        self.started = threading.Semaphore(0)
+        self.release = None
+
+    async def __call__(self, player_name, message, interrupted):
+        self.calls.append((player_name, message, list(interrupted)))
+        self.actions.extend(message.split("\n"))
+        self.started.release()
+        if self.release is None:
+            self.release = asyncio.Event()
+        await self.release.wait()
+
+
+@pytest.fixture
+def handler():
+    return RecordingHandler()
+
+
+@pytest.fixture
+def dispatcher(handler):
+    dispatcher = ChatDispatcher(handler, max_concurrency=1, max_queue_depth=2, debounce=0).start()
+    yield dispatcher
+    dispatcher.stop()
+
+
+def test_cancelled_turn_is_not_repeated(dispatcher, handler):
+    dispatcher.submit('alex', 'dig a hole')
+    assert handler.started.acquire(timeout=5)
+
+    dispatcher.submit('alex', 'stop')
+    assert handler.started.acquire(timeout=5)
+
+    assert handler.calls == [
+        ('alex', 'dig a hole', []),
+        ('alex', 'stop', ['dig a hole']),
+    ]
+    assert handler.actions == ['dig a hole', 'stop']
+    assert dispatcher.pending() == 0
+
@@ -0,0 +1,55 @@
+import pytest
+
+from action_registry import Param, ParameterError
+from fill_planner import check_block, fill_commands
+
+
+@pytest.mark.parametrize('block, expected', [
+    ('stone', 'minecraft:stone'),
+    ('minecraft:oak_planks', 'minecraft:oak_planks'),
+    ('oak_stairs[facing=east,half=top]', 'minecraft:oak_stairs[facing=east,half=top]'),
+    ('mod.name:blocks/glass-pane', 'mod.name:blocks/glass-pane'),
+])
+def test_block_ids_are_accepted(block, expected):
+    assert check_block(block) == expected
+
+
+@pytest.mark.parametrize('block', [
+    'command_block{Command:"op me",auto:1b}',
+    'stone{}',
+    'stone replace',
+    'stone\nsay hi',
+    'stone ',
+    'Stone',
+    '',
+    'command_block',
+    'minecraft:repeating_command_block',
+    'chain_command_block[facing=up]',
+    'structure_block',
+    'minecraft:jigsaw',
+    'other:command_block',
+    ['stone'],
+], ids=[
+    'nbt', 'empty-nbt', 'extra-argument', 'newline', 'trailing-space', 'upper-case', 'empty',
+    'command-block', 'repeating-command-block', 'chain-command-block', 'structure-block', 'jigsaw',
+    'other-namespace', 'not-a-string',
+])
+def test_unsafe_block_names_are_refused(block):
+    with pytest.raises(ValueError):
+        check_block(block)
+    with pytest.raises(ValueError):
+        fill_commands([(0, 0, 0, 1, 1, 1)], (0, 0, 0), block)
+
+
+def test_refused_block_name_is_a_parameter_error():
+    param = Param('block_name', 'string', parse=check_block)
+    assert param.decode('stone') == 'minecraft:stone'
+    with pytest.raises(ParameterError):
+        param.decode('command_block{Command:"op me",auto:1b}')
+
+
+def test_fill_commands_use_namespaced_ids():
+    assert fill_commands([(0, 0, 0, 1, 0, 0), (3, 0, 0, 3, 0, 0)], (10, 64, 10), 'stone') == [
+        "fill 10 64 10 11 64 10 minecraft:stone",
+        "setblock 13 64 10 minecraft:stone",
+    ]
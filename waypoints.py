@@ -0,0 +1,175 @@
+"""
+This module keeps the named places players send the bot to, and the trips
+known to work between them.
+
+Each waypoint is a name and a position. Whenever the bot walks from one
+waypoint to another, the trip becomes an edge weighted by the length of the
+path walked. A long trip between two waypoints with no direct edge is then
+routed over the edges with Dijkstra's algorithm, so it becomes a chain of
+short trips the path cache already knows instead of one long search.
+
+Waypoints and edges are saved to a JSON file so they outlive a restart.
+"""
+
+import heapq
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+
+
+def _normalize(name):
+    return " ".join(name.lower().split())
+
+
+class WaypointGraph:
+    """
+    Named waypoints joined by known trips.
+
+    Args:
+        path (str): JSON file the waypoints are saved in. None keeps them in
+            memory only.
+    """
+
+    def __init__(self, path=None):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        # name -> (x, y, z)
+        self._points = {}
+        # name -> {name: cost}
+        self._edges = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self):
+        return len(self._points)
+
+    def get(self, name):
+        """Returns a waypoint's position, or None."""
+        return self._points.get(_normalize(name))
+
+    def items(self):
+        """Returns (name, position) pairs sorted by name."""
+        with self._lock:
+            return sorted(self._points.items())
+
+    def set(self, name, position):
+        """Adds or moves a waypoint. A moved waypoint forgets its edges."""
+        name = _normalize(name)
+        position = tuple(round(float(value), 1) for value in position)
+        with self._lock:
+            if self._points.get(name) != position:
+                self._drop_edges(name)
+            self._points[name] = position
+        self._save()
+        return name
+
+    def remove(self, name):
+        """Removes a waypoint. Returns whether there was one."""
+        name = _normalize(name)
+        with self._lock:
+            if self._points.pop(name, None) is None:
+                return False
+            self._drop_edges(name)
+        self._save()
+        return True
+
+    def nearest(self, position, max_distance):
+        """Returns the name of the nearest waypoint within max_distance, or None."""
+        with self._lock:
+            best = min(self._points.items(), key=lambda item: math.dist(item[1], position), default=None)
+        if best is None or math.dist(best[1], position) > max_distance:
+            return None
+        return best[0]
+
+    def connect(self, a, b, cost):
+        """Records a trip between two waypoints. Trips are assumed to work both ways."""
+        a, b = _normalize(a), _normalize(b)
+        if a == b:
+            return
+        with self._lock:
+            if a not in self._points or b not in self._points:
+                return
+            self._edges.setdefault(a, {})[b] = cost
+            self._edges.setdefault(b, {})[a] = cost
+        self._save()
+
+    def disconnect(self, a, b):
+        """Forgets the trip between two waypoints, e.g. after it failed."""
+        a, b = _normalize(a), _normalize(b)
+        with self._lock:
+            self._edges.get(a, {}).pop(b, None)
+            self._edges.get(b, {}).pop(a, None)
+        self._save()
+
+    def route(self, a, b):
+        """
+        Finds the cheapest chain of known trips between two waypoints.
+
+        Returns:
+            list: Waypoint names from a to b, or None if they are not
+                connected.
+        """
+        a, b = _normalize(a), _normalize(b)
+        with self._lock:
+            if a not in self._points or b not in self._points:
+                return None
+            edges = {name: dict(neighbours) for name, neighbours in self._edges.items()}
+
+        costs = {a: 0.0}
+        previous = {}
+        queue = [(0.0, a)]
+        while queue:
+            cost, name = heapq.heappop(queue)
+            if name == b:
+                break
+            if cost > costs[name]:
+                continue
+            for neighbour, step in edges.get(name, {}).items():
+                new_cost = cost + step
+                if new_cost < costs.get(neighbour, math.inf):
+                    costs[neighbour] = new_cost
+                    previous[neighbour] = name
+                    heapq.heappush(queue, (new_cost, neighbour))
+        if b not in costs:
+            return None
+
+        route = [b]
+        while route[-1] != a:
+            route.append(previous[route[-1]])
+        return route[::-1]
+
+    def _drop_edges(self, name):
+        for neighbour in self._edges.pop(name, {}):
+            self._edges.get(neighbour, {}).pop(name, None)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self._points = {name: tuple(position) for name, position in data.get('waypoints', {}).items()}
+            for a, b, cost in data.get('edges', []):
+                self._edges.setdefault(a, {})[b] = cost
+                self._edges.setdefault(b, {})[a] = cost
+        except (OSError, ValueError, TypeError) as e:
+            self.logger.warning(f"Could not read waypoints from {self.path}: {e}")
+
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {
+                'waypoints': {name: list(position) for name, position in self._points.items()},
+                'edges': [[a, b, cost] for a, neighbours in self._edges.items() for b, cost in neighbours.items() if a < b],
+            }
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as f:
+                json.dump(data, f, indent=2)
+            os.replace(f.name, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not save waypoints to {self.path}: {e}")
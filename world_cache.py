@@ -0,0 +1,332 @@
+"""
+This module keeps a Python-side copy of the blocks around the bot.
+
+The world is stored as 16x16x16 chunk sections of uint16 block state ids,
+one NumPy array per section, with all-air sections stored as None. Columns
+are read when mineflayer emits chunkColumnLoad, kept current from
+blockUpdate, and dropped on chunkColumnUnload. Only columns within a radius
+of the bot are kept, and the farthest sections are evicted once the cache
+reaches its size cap. Block updates are filtered on the javascript side, so
+only those in cached columns, or that change a block's shape, cross the
+bridge.
+
+Lookups such as "what is at x, y, z" and "where is the nearest block of type
+T" are then answered from memory instead of over the javascript bridge.
+"""
+
+import json
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from javascript import On
+
+from structured_logging import RateLimitedLog
+from world_query import UNKNOWN_STATE, BlockInfo, BlockRegion, decode_states, evaluate
+
+SECTION_SIZE = 16
+AIR_STATE = 0
+
+
+class WorldCache:
+    """
+    Chunk sections around the bot, held as compact arrays.
+
+    Args:
+        bot: The mineflayer bot.
+        max_sections (int): Non-empty sections to keep in memory. Each one
+            takes 8 KiB.
+        radius (int): Columns farther than this many chunks from the bot are
+            not cached.
+    """
+
+    def __init__(self, bot, max_sections=2048, radius=4):
+        self.logger = logging.getLogger(__name__)
+        self.chunk_log = RateLimitedLog(self.logger)
+        self.bot = bot
+        self.max_sections = max_sections
+        self.radius = radius
+        self._sections = {}
+        self._columns = set()
+        self._palette = {}
+        self._listeners = []
+        # (cx, cz) -> one list per load in progress, of the block updates
+        # that arrived after its snapshot was taken
+        self._loading = {}
+        self._lock = threading.RLock()
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='world-cache')
+
+        @On(bot, 'chunkColumnLoad')
+        def on_chunk_column_load(this, point, *args):
+            self._loader.submit(self._on_column_load, int(point.x) >> 4, int(point.z) >> 4)
+
+        @On(bot, 'chunkColumnUnload')
+        def on_chunk_column_unload(this, point, *args):
+            self.drop_column(int(point.x) >> 4, int(point.z) >> 4)
+
+        # Forwards block updates as plain arrays, which arrive without a
+        # further round trip.
+        evaluate('''
+            bot.worldCacheColumns = new Set()
+            bot.on('blockUpdate', (oldBlock, block) => {
+              if (!block) return
+              const p = block.position
+              const shapeChanged = !oldBlock || oldBlock.boundingBox !== block.boundingBox
+              if (!shapeChanged && !bot.worldCacheColumns.has((p.x >> 4) + ',' + (p.z >> 4))) return
+              bot.emit('worldCacheBlockUpdate', [p.x, p.y, p.z, block.stateId, shapeChanged])
+            })
+        ''', bot=bot)
+
+        @On(bot, 'worldCacheBlockUpdate')
+        def on_block_update(this, update, *args):
+            self._on_block_update(*update)
+
+    def __len__(self):
+        return len(self._sections)
+
+    def add_listener(self, listener):
+        """
+        Calls listener(x, y, z, shape_changed) whenever a block in a cached
+        column changes, and whenever any block changes shape. shape_changed
+        is whether the block's collision shape changed, e.g. air to stone,
+        as opposed to a crop growing.
+        """
+        self._listeners.append(listener)
+
+    def block_at(self, x, y, z):
+        """Returns the state id at world coordinates, or None if not cached."""
+        key = (x >> 4, y >> 4, z >> 4)
+        with self._lock:
+            if key not in self._sections:
+                return None
+            section = self._sections[key]
+        if section is None:
+            return AIR_STATE
+        return int(section[x & 15, y & 15, z & 15])
+
+    def block_info(self, x, y, z):
+        """Returns the BlockInfo at world coordinates, or None if not cached."""
+        state = self.block_at(x, y, z)
+        if state is None:
+            return None
+        return self.palette([state]).get(state)
+
+    def region(self, min_corner, max_corner):
+        """
+        Builds a BlockRegion from cached sections, loading missing columns.
+
+        Returns:
+            BlockRegion: The same result WorldQuery.blocks would return, with
+                UNKNOWN_STATE for blocks in columns that could not be loaded.
+        """
+        (x0, y0, z0), (x1, y1, z1) = min_corner, max_corner
+        for cx in range(x0 >> 4, (x1 >> 4) + 1):
+            for cz in range(z0 >> 4, (z1 >> 4) + 1):
+                if (cx, cz) not in self._columns:
+                    self.load_column(cx, cz)
+
+        states = np.full((x1 - x0 + 1, y1 - y0 + 1, z1 - z0 + 1), UNKNOWN_STATE, dtype=np.uint16)
+        with self._lock:
+            for (sx, sy, sz), section in self._sections.items():
+                # Overlap of this section with the region, in world coordinates.
+                lx, ly, lz = max(x0, sx * 16), max(y0, sy * 16), max(z0, sz * 16)
+                hx, hy, hz = min(x1, sx * 16 + 15), min(y1, sy * 16 + 15), min(z1, sz * 16 + 15)
+                if lx > hx or ly > hy or lz > hz:
+                    continue
+                target = (slice(lx - x0, hx - x0 + 1), slice(ly - y0, hy - y0 + 1), slice(lz - z0, hz - z0 + 1))
+                if section is None:
+                    states[target] = AIR_STATE
+                else:
+                    states[target] = section[lx & 15:(hx & 15) + 1, ly & 15:(hy & 15) + 1, lz & 15:(hz & 15) + 1]
+
+        return BlockRegion((x0, y0, z0), states, self.palette(np.unique(states)))
+
+    def find_blocks(self, names, origin, max_distance=32, count=1):
+        """
+        Finds the cached blocks of the given types nearest to a point.
+
+        Args:
+            names (list): Block names, such as ['oak_log', 'birch_log'].
+            origin (tuple): World coordinates to measure from.
+            max_distance (float): Search radius.
+            count (int): Number of blocks to return.
+
+        Returns:
+            list: (x, y, z) tuples, nearest first.
+        """
+        states = self.state_ids(names)
+        if not states:
+            return []
+        wanted = np.array(sorted(states), dtype=np.uint16)
+        origin = np.asarray(origin, dtype=float)
+        found = []
+
+        with self._lock:
+            candidates = []
+            for key, section in self._sections.items():
+                if section is None:
+                    continue
+                corner = np.array(key) * SECTION_SIZE
+                # Distance from the origin to the nearest point of the section.
+                gap = np.maximum(0, np.maximum(corner - origin, origin - (corner + SECTION_SIZE)))
+                distance = float(np.linalg.norm(gap))
+                if distance <= max_distance:
+                    candidates.append((distance, key, section))
+            candidates.sort(key=lambda candidate: candidate[0])
+
+            for distance, key, section in candidates:
+                if len(found) >= count and distance > found[count - 1][0]:
+                    break
+                hits = np.argwhere(np.isin(section, wanted))
+                if not len(hits):
+                    continue
+                positions = hits + np.array(key) * SECTION_SIZE
+                distances = np.linalg.norm(positions + 0.5 - origin, axis=1)
+                for position, hit_distance in zip(positions, distances):
+                    if hit_distance <= max_distance:
+                        found.append((float(hit_distance), tuple(int(v) for v in position)))
+                found.sort(key=lambda hit: hit[0])
+                del found[count:]
+
+        return [position for _, position in found]
+
+    def state_ids(self, names):
+        """Returns every state id belonging to the named block types."""
+        result = json.loads(evaluate('''
+            const out = []
+            for (const name of __NAMES__) {
+              const block = bot.registry.blocksByName[name]
+              if (block) for (let s = block.minStateId; s <= block.maxStateId; s++) out.push(s)
+            }
+            return JSON.stringify(out)
+        '''.replace('__NAMES__', json.dumps(list(names))), bot=self.bot))
+        return set(result)
+
+    def palette(self, states):
+        """Returns BlockInfo for the given state ids, asking the bridge only for new ones."""
+        states = [int(state) for state in states]
+        missing = [state for state in states if state not in self._palette]
+        if missing:
+            infos = json.loads(evaluate('''
+                const out = {}
+                for (const state of __STATES__) {
+                  const block = bot.registry.blocksByStateId[state]
+                  out[state] = block ? [block.name, block.material || '', block.diggable, block.hardness] : null
+                }
+                return JSON.stringify(out)
+            '''.replace('__STATES__', json.dumps(missing)), bot=self.bot))
+            for state, info in infos.items():
+                if info:
+                    self._palette[int(state)] = BlockInfo(*info)
+        return {state: self._palette[state] for state in states if state in self._palette}
+
+    def load_column(self, cx, cz):
+        """Reads a whole chunk column over the bridge and caches its sections."""
+        # Updates that arrive while the column is read are buffered and
+        # applied on top of the snapshot, so none are lost.
+        buffer = []
+        with self._lock:
+            self._loading.setdefault((cx, cz), []).append(buffer)
+        try:
+            return self._load_column(cx, cz, buffer)
+        finally:
+            with self._lock:
+                buffers = self._loading[(cx, cz)]
+                buffers.remove(buffer)
+                if not buffers:
+                    del self._loading[(cx, cz)]
+
+    def _load_column(self, cx, cz, buffer):
+        result = evaluate('''
+            const column = bot.world.getColumn(cx, cz)
+            if (!column) return null
+            bot.worldCacheColumns.add(cx + ',' + cz)
+            const Vec3 = bot.entity.position.constructor
+            const minY = bot.game.minY || 0
+            const height = bot.game.height || 256
+            const sections = {}
+            for (let base = minY; base < minY + height; base += 16) {
+              const states = new Uint16Array(4096)
+              let empty = true
+              let i = 0
+              for (let x = 0; x < 16; x++) {
+                for (let y = 0; y < 16; y++) {
+                  for (let z = 0; z < 16; z++) {
+                    const state = bot.world.getBlockStateId(new Vec3(cx * 16 + x, base + y, cz * 16 + z)) || 0
+                    if (state !== 0) empty = false
+                    states[i++] = state
+                  }
+                }
+              }
+              sections[base >> 4] = empty ? null : Buffer.from(states.buffer).toString('base64')
+            }
+            return JSON.stringify(sections)
+        ''', bot=self.bot, cx=cx, cz=cz)
+        if result is None:
+            return False
+
+        sections = json.loads(result)
+        with self._lock:
+            for sy, data in sections.items():
+                key = (cx, int(sy), cz)
+                self._sections[key] = None if data is None else decode_states(data, (16, 16, 16)).copy()
+            self._columns.add((cx, cz))
+            for update in buffer:
+                self._set_state(*update)
+            buffer.clear()
+        self._enforce_cap()
+        return True
+
+    def drop_column(self, cx, cz):
+        """Forgets every section of a chunk column."""
+        with self._lock:
+            self._columns.discard((cx, cz))
+            for key in [key for key in self._sections if key[0] == cx and key[2] == cz]:
+                del self._sections[key]
+        evaluate("bot.worldCacheColumns.delete(cx + ',' + cz)", bot=self.bot, cx=cx, cz=cz)
+
+    def _on_column_load(self, cx, cz):
+        try:
+            bx, bz = self._bot_chunk()
+            if max(abs(cx - bx), abs(cz - bz)) <= self.radius:
+                self.load_column(cx, cz)
+        except Exception as e:
+            self.chunk_log.warning('load', "Could not cache chunk %s, %s: %s", cx, cz, e)
+
+    def _on_block_update(self, x, y, z, state, shape_changed):
+        x, y, z = int(x), int(y), int(z)
+        for listener in self._listeners:
+            listener(x, y, z, shape_changed)
+        with self._lock:
+            for buffer in self._loading.get((x >> 4, z >> 4), ()):
+                buffer.append((x, y, z, state))
+            self._set_state(x, y, z, state)
+
+    def _set_state(self, x, y, z, state):
+        key = (x >> 4, y >> 4, z >> 4)
+        with self._lock:
+            if key not in self._sections:
+                return
+            section = self._sections[key]
+            if section is None:
+                if state == AIR_STATE:
+                    return
+                section = self._sections[key] = np.zeros((16, 16, 16), dtype=np.uint16)
+            section[x & 15, y & 15, z & 15] = state
+
+    def _enforce_cap(self):
+        with self._lock:
+            stored = [key for key, section in self._sections.items() if section is not None]
+        if len(stored) <= self.max_sections:
+            return
+        bx, bz = self._bot_chunk()
+        stored.sort(key=lambda key: math.hypot(key[0] - bx, key[2] - bz), reverse=True)
+        # Losing any section means the column is no longer complete.
+        for cx, cz in {(key[0], key[2]) for key in stored[:len(stored) - self.max_sections]}:
+            self.drop_column(cx, cz)
+
+    def _bot_chunk(self):
+        position = self.bot.entity.position
+        return math.floor(position.x) >> 4, math.floor(position.z) >> 4
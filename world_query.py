@@ -0,0 +1,159 @@
+"""
+This module reads the game world in bulk.
+
+Every attribute access on a mineflayer proxy is a synchronous round trip over
+the javascript bridge, so asking for a region block by block costs several
+round trips per block. The queries here run the whole loop inside the
+JavaScript runtime and send the answer back in a single bridge call, packed
+into compact NumPy arrays.
+"""
+
+import base64
+import json
+from collections import namedtuple
+
+import numpy as np
+from javascript import config
+
+# State id used for blocks in chunks the bot has not loaded.
+UNKNOWN_STATE = 0xFFFF
+
+AIR_BLOCKS = frozenset({'air', 'cave_air', 'void_air'})
+
+BlockInfo = namedtuple('BlockInfo', ['name', 'material', 'diggable', 'hardness'])
+
+
+def evaluate(code, timeout=10, **variables):
+    """
+    Runs a block of JavaScript in a single bridge round trip.
+
+    The keyword arguments are made available to the code as variables. Only
+    numbers, booleans, None and javascript proxies are passed by value.
+    """
+    return config.global_jsi.evaluateWithContext(code, variables, forceRefs=True, timeout=timeout)
+
+
+def decode_states(data, shape):
+    """Unpacks base64 encoded little-endian uint16 state ids into an array."""
+    return np.frombuffer(base64.b64decode(data), dtype='<u2').reshape(shape)
+
+
+class BlockRegion:
+    """
+    The block states of a cuboid.
+
+    Attributes:
+        origin (tuple): World coordinates of states[0, 0, 0].
+        states (numpy.ndarray): uint16 state ids indexed [x, y, z].
+        palette (dict): BlockInfo for every state id present in the region.
+    """
+
+    def __init__(self, origin, states, palette):
+        self.origin = origin
+        self.states = states
+        self.palette = palette
+
+    def mask(self, predicate):
+        """Returns a boolean array of the blocks whose BlockInfo matches predicate."""
+        selected = [state for state, info in self.palette.items() if predicate(info)]
+        return np.isin(self.states, selected)
+
+    def diggable(self):
+        """Returns a boolean array of the blocks that can be dug."""
+        return self.mask(
+            lambda info: info.diggable
+            and info.hardness is not None
+            and info.hardness >= 0
+            and info.name not in AIR_BLOCKS
+        )
+
+    def coordinates(self, mask):
+        """Returns the world coordinates of the selected blocks as an (N, 3) array."""
+        return np.argwhere(mask) + np.asarray(self.origin)
+
+    def info_at(self, x, y, z):
+        """Returns the BlockInfo at world coordinates, or None if unknown."""
+        ox, oy, oz = self.origin
+        return self.palette.get(int(self.states[x - ox, y - oy, z - oz]))
+
+
+class WorldQuery:
+    """
+    Bulk queries against the bot's view of the world.
+
+    Args:
+        bot: The mineflayer bot.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    def blocks(self, min_corner, max_corner):
+        """
+        Reads the block states of a cuboid, corners inclusive, in one bridge call.
+
+        Returns:
+            BlockRegion: The states, with UNKNOWN_STATE for unloaded blocks.
+        """
+        (x0, y0, z0), (x1, y1, z1) = min_corner, max_corner
+        result = json.loads(evaluate('''
+            const Vec3 = bot.entity.position.constructor
+            const sx = x1 - x0 + 1, sy = y1 - y0 + 1, sz = z1 - z0 + 1
+            const states = new Uint16Array(sx * sy * sz)
+            const palette = {}
+            let i = 0
+            for (let x = x0; x <= x1; x++) {
+              for (let y = y0; y <= y1; y++) {
+                for (let z = z0; z <= z1; z++) {
+                  let state = bot.world.getBlockStateId(new Vec3(x, y, z))
+                  if (state === undefined || state === null) state = unknown
+                  states[i++] = state
+                  if (!(state in palette)) {
+                    const block = bot.registry.blocksByStateId[state]
+                    palette[state] = block ? [block.name, block.material || '', block.diggable, block.hardness] : null
+                  }
+                }
+              }
+            }
+            return JSON.stringify({
+              states: Buffer.from(states.buffer).toString('base64'),
+              palette
+            })
+        ''', bot=self.bot, x0=x0, y0=y0, z0=z0, x1=x1, y1=y1, z1=z1, unknown=UNKNOWN_STATE))
+
+        shape = (x1 - x0 + 1, y1 - y0 + 1, z1 - z0 + 1)
+        palette = {int(state): BlockInfo(*info) for state, info in result['palette'].items() if info}
+        return BlockRegion((x0, y0, z0), decode_states(result['states'], shape), palette)
+
+    def player_positions(self, player_names=None):
+        """
+        Reads the positions of players in one bridge call.
+
+        Args:
+            player_names (list): Players to look up. Defaults to every player
+                the bot knows about.
+
+        Returns:
+            tuple: The player names and an (N, 3) float array of their
+                positions. Players out of render range have NaN positions.
+        """
+        # Strings cannot be passed as variables, so the names are written into
+        # the code as a JSON literal.
+        result = json.loads(evaluate('''
+            const wanted = __NAMES__ || Object.keys(bot.players)
+            const positions = wanted.map(name => {
+              const entity = bot.players[name] && bot.players[name].entity
+              return entity ? [entity.position.x, entity.position.y, entity.position.z] : [null, null, null]
+            })
+            return JSON.stringify({ names: wanted, positions })
+        '''.replace('__NAMES__', json.dumps(player_names)), bot=self.bot))
+
+        positions = np.array(result['positions'], dtype=float).reshape(-1, 3)
+        return result['names'], positions
+
+    def bot_position(self):
+        """Returns the bot's position as a float array."""
+        return np.array(json.loads(evaluate('''
+            const p = bot.entity.position
+            return JSON.stringify([p.x, p.y, p.z])
+        ''', bot=self.bot)))